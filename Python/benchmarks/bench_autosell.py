@@ -0,0 +1,81 @@
+"""
+Autosell evaluation per market tick: one indexed select of a stock's open autosell
+trades plus a Python threshold check per trade (what the autosell check did before the
+index), against popping crossed trades off the in-memory AutosellIndex heaps.
+Prices move a little each tick so a few trades cross; both must find the same ones.
+
+    cd Python && python -m benchmarks.bench_autosell
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from utils.database import Database
+from utils.model import *
+from utils.stocks.autosell import AutosellIndex
+from utils.stocks.stock_db import AUTOSELL_TRADES
+
+STOCKS = 7
+OPEN_TRADES = [100, 1000, 10000]
+TICKS = 50
+
+
+def make_trades(n: int) -> list[Trade]:
+    return [
+        Trade(None, 1, 1.0, None, 1, random.randint(1, STOCKS), auto_sell_low=random.uniform(0.5, 0.99), auto_sell_high=random.uniform(1.01, 1.5))
+        for _ in range(n)
+    ]
+
+
+def price_path() -> list[list[float]]:
+    prices, path = [1.0] * STOCKS, []
+    for _ in range(TICKS):
+        prices = [p * random.uniform(0.99, 1.01) for p in prices]
+        path.append(prices)
+    return path
+
+
+async def scan(db: Database, path: list[list[float]]) -> tuple[float, set[int]]:
+    sold: set[int] = set()
+    start = time.perf_counter()
+    for prices in path:
+        for stock, price in enumerate(prices, 1):
+            for trade in await db.select(Trade, where=AUTOSELL_TRADES.bind(stock=stock)):
+                if trade.id not in sold and (trade.auto_sell_low > price or trade.auto_sell_high < price):
+                    sold.add(trade.id)  # closing is the same for both, so not timed
+    return time.perf_counter() - start, sold
+
+
+def with_index(trades: list[Trade], path: list[list[float]]) -> tuple[float, set[int]]:
+    index = AutosellIndex()
+    index.load(trades)
+    sold: set[int] = set()
+    start = time.perf_counter()
+    for prices in path:
+        for stock, price in enumerate(prices, 1):
+            sold.update(hit.trade_id for hit in index.crossed(stock, price, price))
+    return time.perf_counter() - start, sold
+
+
+async def main():
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in OPEN_TRADES:
+            path = os.path.join(tmp, f"autosell_{n}.db")
+            trades = make_trades(n)
+            async with Database(path) as db:
+                await db.create_table(Trade)
+                await db.insert_many(trades)
+
+            prices = price_path()
+            async with Database(path, readonly=True) as db:
+                scan_time, scan_sold = await scan(db, prices)
+            index_time, index_sold = with_index(trades, prices)
+            assert scan_sold == index_sold, "index and scan disagree"
+            print(f"{n:>6} open trades, {TICKS} ticks   select+check {scan_time * 1000 / TICKS:8.3f}ms/tick   index {index_time * 1000 / TICKS:7.3f}ms/tick   ({len(index_sold)} sold)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
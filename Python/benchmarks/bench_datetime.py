@@ -0,0 +1,71 @@
+"""
+DATETIME columns stored as ISO-8601 text against epoch_datetime() integers.
+
+Loads a log-sized table of each kind and times decoding every row and a one-hour
+range scan on an indexed timestamp, and reports the size of the table and its index.
+The text rows are parsed with fromisoformat by the DATETIME converter, the integer
+rows with int() and exact timedelta arithmetic; the C parser is the faster of the two, so the
+integers win on size (and sub-second precision), not on decode time.
+
+    cd Python && python -m benchmarks.bench_datetime
+"""
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+
+from utils.database import Database
+from utils.registry import model_info
+from utils.model import epoch_datetime, indexed
+from utils.query import F
+
+ROWS = 50_000
+REPEATS = 5
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@dataclass
+class IsoEvent:
+    id: int
+    timestamp: datetime.datetime = indexed()
+
+@dataclass
+class EpochEvent:
+    id: int
+    timestamp: datetime.datetime = epoch_datetime(index=True)
+
+
+async def best_of(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        async with Database(os.path.join(tmp, "bench.db")) as db:
+            for model in (IsoEvent, EpochEvent):
+                await db.create_table(model)
+                await db.reconcile_indexes([model])
+                await db.insert_many([model(None, START + datetime.timedelta(seconds=i * 7)) for i in range(ROWS)])
+            await db.con.commit()
+
+            lo = START + datetime.timedelta(days=1)
+            hi = lo + datetime.timedelta(hours=1)
+            for label, model in (("iso text", IsoEvent), ("epoch us", EpochEvent)):
+                decode = await best_of(lambda: db.select(model))
+                scan = await best_of(lambda: db.select(model, (F("timestamp") >= lo) & (F("timestamp") < hi)))
+                found = len(await db.select(model, (F("timestamp") >= lo) & (F("timestamp") < hi)))
+                table = model_info(model).table
+                cur = await db.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN (?, ?)", (table, f"ix_{table}_timestamp"))
+                size = (await cur.fetchone())[0]
+                print(f"{label:<9} decode {ROWS} rows {decode * 1000:7.2f}ms   1h range scan {scan * 1000:6.2f}ms ({found} rows)   table+index {size / 1024:6.0f}KiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Stock-tick workload with and without change tracking.
+
+Every tick loads all stocks, moves them the way the market update does and writes
+each one back. An untracked copy of Stock writes every non-None column; the
+@track_changes Stock only writes what moved, and skips stocks that didn't.
+
+    cd Python && python -m benchmarks.bench_dirty_tracking
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+
+from utils.database import Database
+from utils.model import Stock
+from utils.stocks.stock_controls import update_stock
+
+STOCKS = 200
+TICKS = 50
+IDLE = 0.5  # share of stocks left untouched on a tick
+
+
+@dataclass
+class UntrackedStock:
+    id: int
+    name: str
+    code: str
+    value: float
+    drift: float
+    volatility: float
+    volume: float
+    volume_this_frame: float
+    actor_target_price: float
+
+
+async def run(db: Database, model: type) -> tuple[float, int, int]:
+    await db.create_table(model)
+    await db.insert_many([model(None, f"S{i}", f"S{i:03}", 10.0, 0.0, 0.1, 100.0, 0.0, 10.0) for i in range(STOCKS)])
+    await db.con.commit()
+
+    statements: list[str] = []
+    await db.con.set_trace_callback(statements.append)
+    random.seed(1)
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        for stock in await db.select(model):
+            if random.random() >= IDLE:
+                await update_stock(stock, 1.0)
+            await db.update(stock)
+        await db.con.commit()
+    elapsed = time.perf_counter() - start
+    await db.con.set_trace_callback(None)
+
+    updates = [sql for sql in statements if sql.startswith("UPDATE")]
+    columns = sum(sql.split(" WHERE ")[0].count("=") for sql in updates)
+    return elapsed, len(updates), columns
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        async with Database(os.path.join(tmp, "bench.db")) as db:
+            for label, model in (("untracked", UntrackedStock), ("tracked", Stock)):
+                elapsed, updates, columns = await run(db, model)
+                print(f"{label:<10} {elapsed / TICKS * 1000:7.2f}ms/tick   {updates / TICKS:6.1f} UPDATEs/tick   {columns / max(updates, 1):4.1f} columns/UPDATE")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
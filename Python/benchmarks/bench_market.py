@@ -0,0 +1,79 @@
+"""
+Market catch-up: the per-stock coroutine loop (stock_controls.update_stocks_rand)
+against the vectorised engine (stock_engine.advance), for a few market sizes and
+idle periods, best of a few runs each. The engine steps markets smaller than
+SMALL_MARKET stock by stock on floats and larger ones on arrays; both are checked to
+give the same prices from the same draws. Then checks loop and engine produce the same
+distribution: many copies of one stock are advanced by each and the mean/std of the
+resulting prices compared.
+
+    cd Python && python -m benchmarks.bench_market
+"""
+import asyncio
+import dataclasses
+import random
+import time
+
+import numpy as np
+
+from utils.stocks.stock_controls import update_stocks_rand
+from utils.stocks.stock_control_params import Stocks
+from utils.stocks import stock_engine
+
+SIZES = [7, 100, 1000]          # stocks (7 is the live market)
+IDLE_FRAMES = [1, 288, 8640]    # frames: 5 minutes, a day, a month at 5s per frame
+TRIALS = 4000
+REPEATS = 5
+
+
+def market(n: int) -> list:
+    return [dataclasses.replace(Stocks.StarWheel, id=i, actor_target_price=random.uniform(0.5, 2)) for i in range(n)]
+
+
+async def time_scalar(stocks: list, frames: float) -> float:
+    start = time.perf_counter()
+    await update_stocks_rand(stocks, frames)
+    return time.perf_counter() - start
+
+
+def time_vector(stocks: list, frames: float) -> float:
+    start = time.perf_counter()
+    state = stock_engine.MarketState.from_stocks(stocks)
+    stock_engine.advance(state, frames)
+    state.write_back(stocks)
+    return time.perf_counter() - start
+
+
+async def main():
+    random.seed(1)
+    for n in SIZES:
+        for frames in IDLE_FRAMES:
+            scalar = min([await time_scalar(market(n), frames) for _ in range(REPEATS)])
+            vector = min(time_vector(market(n), frames) for _ in range(REPEATS))
+            print(f"{n:>5} stocks {frames:>6} frames   loop {scalar * 1000:8.2f}ms   engine {vector * 1000:7.2f}ms   x{scalar / vector:6.1f}")
+
+    print()
+    for n in (7, stock_engine.SMALL_MARKET):
+        stocks = market(n)
+        paths = []
+        for step in (stock_engine._advance_small, stock_engine._advance_vector):
+            state, path = stock_engine.MarketState.from_stocks(stocks), stock_engine.PricePath()
+            steps = stock_engine.step_sizes(8640)
+            step(state, steps, np.random.default_rng(1).standard_normal(size=(len(steps), 3, n)), path)
+            paths.append((state.value, state.traded, np.array(path.lows), np.array(path.highs)))
+        same = all(np.allclose(a, b) for a, b in zip(*paths))
+        print(f"{n:>5} stocks, 8640 frames, same draws   small and vector steps agree: {same}")
+
+    print()
+    for frames in (1, 50, 300):
+        scalar_stocks = [dataclasses.replace(Stocks.StarWheel, actor_target_price=1.5) for _ in range(TRIALS)]
+        vector_stocks = [dataclasses.replace(s) for s in scalar_stocks]
+        await update_stocks_rand(scalar_stocks, frames)
+        time_vector(vector_stocks, frames)
+        a = np.array([s.value for s in scalar_stocks])
+        b = np.array([s.value for s in vector_stocks])
+        print(f"{frames:>4} frames, {TRIALS} trials   price mean {a.mean():.4f} / {b.mean():.4f}   std {a.std():.4f} / {b.std():.4f}   (loop / engine)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Per-call Python overhead of the ORM, before and after the model registry.
+
+"legacy" re-creates what Database did on every call before metadata was
+compiled once per model: dataclasses.fields()/asdict(), get_type_hints(),
+the table-name regex and rebuilding the SQL text. No I/O is measured.
+
+    cd Python && python -m benchmarks.bench_orm_overhead
+"""
+import sqlite3
+import timeit
+from dataclasses import asdict, fields
+from typing import get_type_hints
+
+from utils.model import Trade, python_to_table_name
+from utils.registry import model_info
+
+N = 50_000
+
+TRADE = Trade(None, 10, 1.25, None, 1, 2, False, 0.5, 2.0)
+
+
+# --- legacy per-call work ---
+
+def legacy_insert(obj):
+    data = asdict(obj)
+    if data.get("id") in (None, 0):
+        data.pop("id")
+    keys = ", ".join(data.keys())
+    qs = ", ".join("?" for _ in data)
+    return f"INSERT INTO {python_to_table_name(type(obj))} ({keys}) VALUES ({qs})", tuple(data.values())
+
+def legacy_update(obj):
+    data = {k: v for k, v in asdict(obj).items() if v is not None}
+    assigns = ", ".join(f"{k}=?" for k in data.keys())
+    return f"UPDATE {python_to_table_name(type(obj))} SET {assigns}", list(data.values())
+
+def legacy_decode(model, row):
+    get_type_hints(model, include_extras=True)
+    data = {f.name: row[f"r.{f.name}"] for f in fields(model)}
+    return model(**data)
+
+
+# --- registry ---
+
+def registry_insert(obj):
+    info = model_info(type(obj))
+    keys = info.names[1:]
+    return info.insert_sql(keys), info.values(obj)[1:]
+
+def registry_update(obj):
+    info = model_info(type(obj))
+    pairs = [(k, v) for k, v in zip(info.names, info.values(obj)) if v is not None]
+    return info.update_sql(tuple(k for k, _ in pairs)), [v for _, v in pairs]
+
+def registry_decode(model, row):
+    return model(*(row[key] for key in model_info(model).aliased_keys("r")))
+
+
+def make_row():
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    cols = ", ".join(f'? AS "r.{f.name}"' for f in fields(Trade))
+    return con.execute(f"SELECT {cols}", tuple(asdict(TRADE).values())).fetchone()
+
+
+def bench(label: str, legacy, registry):
+    before = timeit.timeit(legacy, number=N) / N * 1e6
+    after = timeit.timeit(registry, number=N) / N * 1e6
+    print(f"{label:<10} legacy {before:7.2f}us/call   registry {after:7.2f}us/call   x{before / after:5.1f}")
+
+
+if __name__ == "__main__":
+    row = make_row()
+    bench("insert", lambda: legacy_insert(TRADE), lambda: registry_insert(TRADE))
+    bench("update", lambda: legacy_update(TRADE), lambda: registry_update(TRADE))
+    bench("decode", lambda: legacy_decode(Trade, row), lambda: registry_decode(Trade, row))
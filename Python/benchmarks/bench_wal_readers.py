@@ -0,0 +1,80 @@
+"""
+Read throughput while writes are happening.
+
+Compares the old topology (a private default-journal connection per unit of
+work) against the pooled single-writer / multi-reader WAL topology.
+
+    cd Python && python -m benchmarks.bench_wal_readers
+"""
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+import utils.database as db_utils
+from utils.model import Log
+
+DURATION = 5.0      # seconds per scenario
+READERS = 8
+WRITERS = 2
+SEED_ROWS = 5000
+
+
+async def seed(path: str):
+    async with db_utils.Database(path) as db:
+        await db.create_table(Log)
+        for i in range(SEED_ROWS):
+            await db.insert(Log(None, datetime.datetime.now(datetime.timezone.utc), "INFO", f"seed {i}"))
+
+
+async def run_scenario(path: str) -> tuple[int, int, int]:
+    reads = writes = errors = 0
+    deadline = time.perf_counter() + DURATION
+
+    async def reader():
+        nonlocal reads, errors
+        while time.perf_counter() < deadline:
+            try:
+                async with db_utils.Database(path, readonly=True) as db:
+                    await db.select(Log, where=[db_utils.WhereParam("level", "INFO")], order=[db_utils.OrderParam("id", True)], limit=100)
+                reads += 1
+            except Exception:
+                errors += 1
+
+    async def writer():
+        nonlocal writes, errors
+        while time.perf_counter() < deadline:
+            try:
+                async with db_utils.Database(path) as db:
+                    await db.insert(Log(None, datetime.datetime.now(datetime.timezone.utc), "DEBUG", "tick"))
+                writes += 1
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(reader() for _ in range(READERS)), *(writer() for _ in range(WRITERS)))
+    return reads, writes, errors
+
+
+def report(label: str, reads: int, writes: int, errors: int):
+    print(f"{label:<40}{reads / DURATION:8.1f} reads/s {writes / DURATION:8.1f} writes/s  {errors} errors")
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await seed(path)
+
+        reads, writes, errors = await run_scenario(path)
+        report("private connections, default journal", reads, writes, errors)
+
+        await db_utils.open_pool(path, size=READERS, single_writer=True, pragmas=db_utils.PragmaConfig())
+        try:
+            reads, writes, errors = await run_scenario(path)
+        finally:
+            await db_utils.close_pool(path)
+        report(f"single writer + {READERS} WAL readers", reads, writes, errors)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
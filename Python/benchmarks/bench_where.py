@@ -0,0 +1,105 @@
+"""
+WHERE clause building: the original per-call builder against utils/query.py:
+shape-cached templates for WhereParam lists and F() predicates built per call,
+and predicates prepared once and only bound per call. No I/O is measured.
+
+The cached WhereParam path is about as fast as the original (it is there for
+validation, not speed; a lone comparison such as an id lookup goes straight to its
+template) and F() built per call is roughly twice as slow. Prepared predicates are
+faster from two terms up, and level with the original for one. So hot call sites
+prepare theirs at import (AUTOSELL_TRADES, OPEN_TRADE, UNSOLD_ORDERS) and id
+lookups stay WhereParam.
+
+    cd Python && python -m benchmarks.bench_where
+"""
+import timeit
+
+from utils.model import Stock, Trade, Purchase
+from utils.query import F, Param, WhereParam, compile_where, join_scope, model_scope, prepare, prepare_join
+
+N = 100_000
+REPEATS = 5
+
+
+# --- original builder ---
+
+def legacy_render(p):
+    if p.value is None and p.cmp in ("=", "IS", "IS NOT"):
+        if p.cmp == "=":
+            return f"{p.field} IS NULL", []
+        return f"{p.field} {p.cmp} NULL", []
+    return f"{p.field} {p.cmp} ?", [p.value]
+
+def legacy_build(where):
+    if not where:
+        return "", []
+    parts, params = [], []
+    for node in where:
+        if isinstance(node, WhereParam):
+            fragment, frag_params = legacy_render(node)
+            parts.append(fragment)
+            params.extend(frag_params)
+            continue
+        if not node:
+            continue
+        or_fragments = []
+        for p in node:
+            fragment, frag_params = legacy_render(p)
+            or_fragments.append(fragment)
+            params.extend(frag_params)
+        parts.append(f"({' OR '.join(or_fragments)})")
+    return " WHERE " + " AND ".join(parts), params
+
+
+CASES = [
+    (
+        "by id",
+        model_scope(Purchase),
+        lambda: [WhereParam("id", 7)],
+        lambda: F("id") == 7,
+        (prepare(Purchase, F("id") == Param("id")), dict(id=7)),
+    ),
+    (
+        "close trade",
+        model_scope(Trade),
+        lambda: [WhereParam("id", 3), WhereParam("sold_at", None, "IS")],
+        lambda: (F("id") == 3) & F("sold_at").is_(None),
+        (prepare(Trade, (F("id") == Param("id")) & F("sold_at").is_(None)), dict(id=3)),
+    ),
+    (
+        "open trade",
+        model_scope(Trade),
+        lambda: [WhereParam("id", 3), WhereParam("user_id", 1), WhereParam("sold_at", None, "IS")],
+        lambda: (F("id") == 3) & (F("user_id") == 1) & F("sold_at").is_(None),
+        (prepare(Trade, (F("id") == Param("id")) & (F("user_id") == Param("user_id")) & F("sold_at").is_(None)), dict(id=3, user_id=1)),
+    ),
+    (
+        "autosell",
+        model_scope(Trade),
+        lambda: [WhereParam("stock", 1), WhereParam("sold_at", None), [WhereParam("auto_sell_low", None, "IS NOT"), WhereParam("auto_sell_high", None, "IS NOT")]],
+        lambda: (F("stock") == 1) & F("sold_at").is_(None) & (F("auto_sell_low").is_not(None) | F("auto_sell_high").is_not(None)),
+        (prepare(Trade, (F("stock") == Param("stock")) & F("sold_at").is_(None) & (F("auto_sell_low").is_not(None) | F("auto_sell_high").is_not(None))), dict(stock=1)),
+    ),
+    (
+        "unsold join",
+        join_scope(("stocks", Stock), ("trades", Trade)),
+        lambda: [WhereParam("trades.user_id", 1), WhereParam("trades.sold_at", None, "IS")],
+        lambda: (F("trades.user_id") == 1) & F("trades.sold_at").is_(None),
+        (prepare_join((Stock, Trade), (F("trades.user_id") == Param("user_id")) & F("trades.sold_at").is_(None)), dict(user_id=1)),
+    ),
+]
+
+
+if __name__ == "__main__":
+    for label, scope, params, predicate, (prepared, values) in CASES:
+        assert compile_where(params(), scope) == legacy_build(params()), label
+        assert compile_where(prepared.bind(**values), scope) == legacy_build(params()), label
+
+        # The clause is rebuilt every call, as callers do; best of a few runs
+        def per_call(f) -> float:
+            return min(timeit.repeat(f, number=N // REPEATS, repeat=REPEATS)) / (N // REPEATS) * 1e6
+        before = per_call(lambda: legacy_build(params()))
+        cached = per_call(lambda: compile_where(params(), scope))
+        expr = per_call(lambda: compile_where(predicate(), scope))
+        bound = per_call(lambda: compile_where(prepared.bind(**values), scope))
+        print(f"{label:<12} legacy {before:5.2f}us   WhereParam {cached:5.2f}us   F() {expr:5.2f}us   prepared {bound:5.2f}us")
@@ -0,0 +1,68 @@
+"""
+Runs the hot ORM queries against a scratch database, captures the SQL they
+generate and checks with EXPLAIN QUERY PLAN that each one is served by one of
+the declared indexes rather than a full table scan. Exits non-zero otherwise.
+
+    cd Python && python -m benchmarks.check_query_plans
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from utils.database import Database, WhereParam, OrderParam, LeftJoin, ledger_sql
+from utils.model import *
+from utils.stocks.stock_db import AUTOSELL_TRADES
+from utils.stocks.price_history import TICK_RANGE, CANDLE_RANGE
+
+USER = 1
+BLACK_FRIDAY_ITEM = 13
+
+# (description, coroutine issuing exactly one query, index (or indexes) expected in the plan)
+HOT_QUERIES = [
+    ("credit", lambda db: db.select(Balance, [WhereParam("id", USER)]), "INTEGER PRIMARY KEY"),
+    ("credit: new user", lambda db: db.execute(f"SELECT TOTAL(delta) FROM ({ledger_sql('?')})", [USER] * len(CREDIT_LEDGER)),
+        ("ix_purchases_user_id", "ix_gamble_wins_user_id", "ix_admin_bets_gamble_user_id", "ix_gifts_giver_receiver", "ix_gifts_receiver")),
+    ("is_ongoing_sale", lambda db: db.select(Purchase, where=[WhereParam("item_id", BLACK_FRIDAY_ITEM)], order=[OrderParam("timestamp", True)]), "ix_purchases_item_id_timestamp"),
+    ("did_gift", lambda db: db.select(Gift, where=[WhereParam("giver", USER), WhereParam("receiver", 2), WhereParam("amount", 60)]), "ix_gifts_giver_receiver"),
+    ("get_bets", lambda db: db.aggregate(AdminBet, sum=["amount"], group_by=["gamble_user_id"], where=[WhereParam("bet_user_id", USER), WhereParam("used", False)]), "ix_admin_bets_bet_user_id_used"),
+    ("autosell", lambda db: db.select(Trade, where=AUTOSELL_TRADES.bind(stock=1)), "ix_trades_stock_sold_at"),
+    ("open trades", lambda db: db.join_select(Stock, Trade, where=[WhereParam("r.user_id", USER), WhereParam("r.sold_at", None, "IS")]), "ix_trades_user_id"),
+    ("portfolio", lambda db: db.join(Trade, Stock, LeftJoin(User), LeftJoin(Balance), where=[WhereParam("trades.user_id", USER), WhereParam("sold_at", None, "IS")]), "ix_trades_user_id"),
+    ("price ticks", lambda db: db.select(PriceTick, where=TICK_RANGE.bind(stock=1, start=0, end=1), order=[OrderParam("at", False)]), "ix_price_ticks_stock_at"),
+    ("price candles", lambda db: db.select(PriceCandle, where=CANDLE_RANGE.bind(stock=1, interval=60, start=0, end=1), order=[OrderParam("start", False)]), "ix_price_candles_stock_interval_start"),
+    ("get_gamble_odds", lambda db: db.aggregate(AdminBet, sum=["amount"], group_by=["bet_user_id", "gamble_user_id"], where=[WhereParam("used", False)]), "ix_admin_bets_used"),
+    ("read_logs by level", lambda db: db.select(Log, where=[WhereParam("level", "ERROR")], order=[OrderParam("id", True)], limit=100), "ix_logs_level"),
+]
+
+
+async def main() -> int:
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.db")
+        async with Database(path) as db:
+            for model in TABLE_MODELS:
+                await db.create_table(model)
+
+            for name, query, expected in HOT_QUERIES:
+                captured: list[str] = []
+                await db.con.set_trace_callback(captured.append)
+                await query(db)
+                await db.con.set_trace_callback(None)
+
+                statements = [sql for sql in captured if sql.lstrip().upper().startswith("SELECT")]
+                assert len(statements) == 1, f"{name}: expected one SELECT, got {statements}"
+
+                cur = await db.execute(f"EXPLAIN QUERY PLAN {statements[0]}")
+                plan = [row[3] for row in await cur.fetchall()]
+                expected = (expected,) if isinstance(expected, str) else expected
+                table_scans = [step for step in plan if step.startswith("SCAN") and not step.startswith("SCAN (subquery")]
+                ok = all(any(ix in step for step in plan) for ix in expected) and not table_scans
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name:<24} {' | '.join(plan)}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,116 @@
+"""
+Runs the migrations and the audit-log ingestion against a scratch database with a
+stand-in guild, and checks the users/balances they leave behind: a full rebuild, an
+incremental catch-up after a member joined, and a member added by on_member_join.
+Members who join after the first rebuild must be able to receive a gift and spend it,
+and someone with no balance at all can still make a spend that costs nothing.
+Exits non-zero otherwise.
+
+    cd Python && python -m benchmarks.check_timeout_ingest
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+OWNER = 99
+START = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Member(SimpleNamespace):
+    pass
+
+
+class Guild:
+    """Just what the ingestion reads: members, the owner and the member_update audit log."""
+    def __init__(self, *member_ids: int):
+        self.owner_id = OWNER
+        self.members = [Member(id=i, bot=False, guild=self) for i in (*member_ids, OWNER)]
+        self.entries = []
+
+    def get_member(self, id: int):
+        return next((m for m in self.members if m.id == id), None)
+
+    def join(self, id: int) -> Member:
+        member = Member(id=id, bot=False, guild=self)
+        self.members.append(member)
+        return member
+
+    def timeout(self, target: int, by: int, minutes: float) -> None:
+        entry_id = len(self.entries) + 1
+        created = START + datetime.timedelta(hours=entry_id)
+        self.entries.append(SimpleNamespace(
+            id=entry_id, target=self.get_member(target), user=self.get_member(by), user_id=by, created_at=created,
+            changes=SimpleNamespace(before=SimpleNamespace(timed_out_until=None), after=SimpleNamespace(timed_out_until=created + datetime.timedelta(minutes=minutes))),
+        ))
+
+    async def audit_logs(self, limit=None, action=None, after=None):
+        entries = [e for e in self.entries if after is None or e.id > after.id]
+        for entry in (entries if after else reversed(entries)):
+            yield entry
+
+
+async def checks() -> list[tuple[str, bool]]:
+    # imported here, after the working directory is the scratch one
+    from utils.database import Database, DATABASE_NAME, WhereParam
+    from utils.model import Balance, Gift
+    import utils.migrations as migration_utils
+    import utils.shop as shop_utils
+    import utils.timeout as timeout_utils
+
+    async def credit(user_id: int):
+        async with Database(DATABASE_NAME, readonly=True) as db:
+            rows = await db.select(Balance, where=[WhereParam("id", user_id)])
+        return rows[0].credit if rows else None
+
+    results = []
+    await migration_utils.init_database([])
+
+    guild = Guild(1, 2)
+    guild.timeout(1, 2, 10)
+    await timeout_utils.ingest_timeouts(guild)
+    results.append(("rebuild", await credit(1) == 600 and await credit(2) == 0 and await credit(OWNER) is None))
+
+    guild.join(3)
+    guild.timeout(2, 1, 1)
+    await timeout_utils.ingest_timeouts(guild)
+    results.append(("joined before catch-up has a balance", await credit(3) == 0))
+
+    guild.join(4)
+    await timeout_utils.ingest_timeouts(guild)  # nothing new in the audit log
+    results.append(("joined, no new entries", await credit(4) == 0))
+
+    await timeout_utils.add_timeout_user(guild.join(5))
+    results.append(("on_member_join", await credit(5) == 0))
+
+    gifted = await shop_utils.spend(1, 60, Gift(None, 60, 1, 3))
+    spent = await shop_utils.spend(3, 45, Gift(None, 45, 3, 5))
+    refused = not await shop_utils.spend(5, 46, Gift(None, 46, 5, 4))
+    results.append(("late joiner receives and spends a gift", gifted and spent and refused and await credit(3) == 15 and await credit(5) == 45))
+
+    # The owner is never given a users row, so has no balance: free is fine, anything else is refused
+    free = await shop_utils.spend(OWNER, 0, Gift(None, 0, OWNER, 3))
+    paid = await shop_utils.spend(OWNER, 1, Gift(None, 1, OWNER, 3))
+    results.append(("no balance row spends nothing", free and not paid and await credit(3) == 15))
+
+    async with Database(DATABASE_NAME, readonly=True) as db:
+        results.append(("no balance drift", not await db.balance_drift()))
+    return results
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.path.insert(0, os.getcwd())
+        os.chdir(tmp)
+        os.mkdir("data")
+        results = asyncio.run(checks())
+
+    for name, ok in results:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return 0 if all(ok for _, ok in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -102,10 +102,13 @@ class AdminRollCog(commands.Cog):
             result = gamble_results[winner]
 
             lines: list[str] = []
+            payouts: dict[int, float] = {}
             for user_id, data in result["bettors"].items():
                 payout = prize * data["odds"]
                 lines.append(f"<@{user_id}> - {timedelta(seconds=round(payout))}")
-                await gamble_utils.payout_gamble(user_id, payout)
+                payouts[user_id] = payout
+
+            await gamble_utils.payout_gambles(payouts)
 
             
 
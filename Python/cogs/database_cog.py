@@ -1,7 +1,7 @@
 import operator
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import traceback
 import logging
@@ -33,6 +33,10 @@ class DatabaseCog(commands.Cog):
         self.bot_ = client
         super().__init__()
         _log.info(f"Cog '{self.qualified_name}' initialized.")
+        self.reconcile_balances_loop.start()
+
+    def cog_unload(self):
+        self.reconcile_balances_loop.cancel()
 
     # --- Slash Command ---
 
@@ -92,6 +96,49 @@ class DatabaseCog(commands.Cog):
             file = discord.File(fp=io.BytesIO(buf.getvalue().encode("utf-8")), filename="results.txt")
             await interaction.followup.send(file=file, ephemeral=True)
 
+    @app_commands.command(name="dbstats", description="Database connection pool statistics")
+    async def dbstats(self, interaction: discord.Interaction):
+        if not bot_utils.is_trusted_developer(interaction):
+            return await interaction.response.send_message("No stats 4 U")
+
+        stats = db_utils.get_pool_stats()
+        if not stats:
+            await interaction.response.send_message("No connection pool is open.", ephemeral=True)
+            return
+
+        lines = []
+        for name, pool in stats.items():
+            avg_wait = pool.total_wait / pool.checkouts if pool.checkouts else 0.0
+            lines += [
+                f"[{name}]",
+                f"Size: {pool.size} ({pool.in_use} in use, {pool.idle} idle, {pool.waiting} waiting)",
+                f"Checkouts: {pool.checkouts}",
+                f"Wait: avg {avg_wait * 1000:.2f}ms, max {pool.max_wait * 1000:.2f}ms",
+            ]
+
+        group = db_utils.get_group_commit_stats()
+        if group:
+            avg_batch = group.writes / group.commits if group.commits else 0.0
+            histogram = ", ".join(f"<={size}: {count}" for size, count in group.batch_sizes.items())
+            lines += [
+                "[group commit]",
+                f"Commits: {group.commits} ({group.commits_per_second:.2f}/s), writes: {group.writes}, avg batch {avg_batch:.1f}",
+                f"Batch sizes: {histogram or 'none'}",
+            ]
+        await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+    # --- Background Tasks ---
+
+    @tasks.loop(hours=1)
+    async def reconcile_balances_loop(self):
+        drift = await db_utils.reconcile_balances()
+        for user_id, stored, expected in drift:
+            _log.warning(f"Balance drift for user {user_id}: stored {stored}, ledger {expected}. Rebuilt balances.")
+
+    @reconcile_balances_loop.before_loop
+    async def before_reconcile_balances(self):
+        await self.bot_.wait_until_ready()
+
     # --- Local Command Error Handler (Overrides the global handler for this cog's commands) ---
 
     async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
@@ -12,6 +12,7 @@ import utils.bot as bot_utils
 import utils.log as log_utils
 import utils.gamble as gamble_utils
 import utils.shop as shop_utils
+from utils.model import AdminBet
 from collections import Counter
 
 _log = logging.getLogger(__name__)
@@ -137,11 +138,11 @@ class GamblingCog(commands.Cog):
             await interaction.followup.send(f"❌ You can't bet on bots.")
             return
 
-        if not await shop_utils.can_afford_purchase(interaction.user.id, round(duration.total_seconds())):
+        amount = round(duration.total_seconds())
+        if not await shop_utils.spend(interaction.user.id, amount, AdminBet(None, amount, interaction.user.id, user.id, False)):
             await interaction.followup.send(f"❌ You can't afford to bet for that duration.")
             return
         
-        await gamble_utils.record_gamble(interaction.user.id, user.id, round(duration.total_seconds()))
         await interaction.followup.send(f"✅ <@{interaction.user.id}> have placed a bet of {duration} on <@{user.id}> to be the next admin!")
 
     # --- Local Command Error Handler (Overrides the global handler for this cog's commands) ---
@@ -15,6 +15,7 @@ import io
 import utils.bot as bot_utils
 import utils.gifts as gift_utils
 import utils.shop as shop_utils
+from utils.model import Gift
 import utils.log as log_utils
 
 _log = logging.getLogger(__name__)
@@ -58,11 +59,9 @@ class GiftingCog(commands.Cog):
         
         gift_value = GIFT_EMOJI_VALUES[emoji_str]
 
-        if not await shop_utils.can_afford_purchase(payload.user_id, gift_value):
+        if not await shop_utils.spend(payload.user_id, gift_value, Gift(None, gift_value, payload.user_id, message.author.id)):
             return
 
-        await gift_utils.add_gift(payload.user_id, message.author.id, gift_value)
-
         await channel.send(f"<@{payload.user_id}> gifted <@{message.author.id}> {datetime.timedelta(seconds=gift_value)} for this message.", reference=message, mention_author=False)
         
 
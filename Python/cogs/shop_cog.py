@@ -69,7 +69,8 @@ class ShopCog(commands.Cog):
 
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        users = { user: await shop_utils.get_shop_credit(user.id) for user in interaction.guild.members if not user.bot and not user.id == interaction.guild.owner_id }
+        credits = await shop_utils.get_all_shop_credit()
+        users = { user: credits.get(user.id, 0) for user in interaction.guild.members if not user.bot and not user.id == interaction.guild.owner_id }
         users = sorted(users.items(), key=operator.itemgetter(1), reverse=True)
 
         embed = discord.Embed(title="💵 How much is everyone worth? 💵", color=discord.Color.blue())
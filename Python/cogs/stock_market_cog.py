@@ -11,6 +11,8 @@
 # import utils.bot as bot_utils
 # import utils.log as log_utils
 # import utils.stocks.stock_db as stock_utils
+# import utils.database as db_utils
+# from utils.session import Session
 # from typing import Optional
 
 # _log = logging.getLogger(__name__)
@@ -82,8 +84,6 @@
 #         guild = self.bot_.get_guild(bot_utils.Guilds.Default) or await self.bot_.fetch_guild(bot_utils.Guilds.Default)
 #         channel = guild.get_channel(bot_utils.Channels.StockMarketSummary) or await guild.fetch_channel(bot_utils.Channels.StockMarketSummary)
         
-#         await stock_utils.update_market_since_last_action(lambda x: print_stock_market_trade(guild, x))
-        
 #         embed = await self.build_market_summary_embed()
 
 #         embed.set_footer(text=f"Last updated: {datetime.datetime.now().replace(microsecond=0)}")
@@ -105,7 +105,7 @@
 #         """Calculates and displays available stocks."""
 #         await interaction.response.defer(ephemeral=True, thinking=True)
 
-#         embed = await self.update_market()
+#         embed = await self.build_market_summary_embed()
 
 #         await interaction.followup.send(embed=embed)
 
@@ -120,14 +120,14 @@
 #     ):
 #         await interaction.response.defer(ephemeral=True)
 
-#         await self.update_market()
-        
-#         valid, reason = await stock_utils.can_afford_stock(interaction.user.id, code, count)
+#         # One session so the stock is only looked up once
+#         async with Session(db_utils.DATABASE_NAME, group_commit=True) as session:
+#             valid, reason = await stock_utils.can_afford_stock(interaction.user.id, code, count, session)
+#             if valid:
+#                 success, msg = await stock_utils.stock_market_buy(interaction.user.id, code, count, autosell_low, autosell_high, session)
 #         if not valid:
 #             await interaction.followup.send(content=reason)
 #             return
-
-#         success, msg = await stock_utils.stock_market_buy(interaction.user.id, code, count, autosell_low, autosell_high)
         
 #         if success:
 #             await print_stock_market_trade(interaction.guild, msg)
@@ -146,14 +146,14 @@
 #     ):
 #         await interaction.response.defer(ephemeral=True)
 
-#         await self.update_market()
-
-#         valid, reason = await stock_utils.can_afford_stock(interaction.user.id, code, count)
+#         # One session so the stock is only looked up once
+#         async with Session(db_utils.DATABASE_NAME, group_commit=True) as session:
+#             valid, reason = await stock_utils.can_afford_stock(interaction.user.id, code, count, session)
+#             if valid:
+#                 success, msg = await stock_utils.stock_market_short(interaction.user.id, code, count, autosell_low, autosell_high, session)
 #         if not valid:
 #             await interaction.followup.send(content=reason)
 #             return
-
-#         success, msg = await stock_utils.stock_market_short(interaction.user.id, code, count, autosell_low, autosell_high)
         
 #         if success:
 #             await print_stock_market_trade(interaction.guild, msg)
@@ -181,11 +181,8 @@
 #     async def command_sell_stock(self, interaction: discord.Interaction, trade_ids: app_commands.Transform[list[int], IntListTransformer]):
 #         await interaction.response.defer(ephemeral=True, thinking=True)
 
-#         await self.update_market()
-
-#         for trade_id in trade_ids:
-#             success, msg = await stock_utils.stock_market_sell(interaction.user.id, trade_id)
-        
+#         results = await stock_utils.stock_market_sell(interaction.user.id, trade_ids)
+#         for success, msg in results:
 #             if success:
 #                 await print_stock_market_trade(interaction.guild, msg)
 #                 await interaction.followup.send(content="✅ Transaction complete", ephemeral=True)
@@ -216,8 +213,6 @@
 #     async def command_display_portfolio(self, interaction: discord.Interaction):
 #         await interaction.response.defer(ephemeral=True, thinking=True)
 
-#         await self.update_market()
-
 #         user_id = interaction.user.id
 
 #         orders = await stock_utils.get_unsold_orders(user_id)
@@ -276,6 +271,13 @@
 #     @market_display_loop.before_loop
 #     async def before_my_task(self):
 #         await self.bot_.wait_until_ready()
+#         # prices move in the background from here on; commands only read the clock's snapshot
+#         guild = self.bot_.get_guild(bot_utils.Guilds.Default) or await self.bot_.fetch_guild(bot_utils.Guilds.Default)
+#         await stock_utils.start_market_clock(lambda x: print_stock_market_trade(guild, x))
+
+#     async def cog_unload(self):
+#         self.market_display_loop.cancel()
+#         await stock_utils.stop_market_clock()
 
 #     # --- Local Command Error Handler (Overrides the global handler for this cog's commands) ---
 
@@ -14,6 +14,7 @@ import io
 
 import utils.bot as bot_utils
 import utils.timeout as timeout_utils
+import utils.audit_log as audit_utils
 import utils.log as log_utils
 
 _log = logging.getLogger(__name__)
@@ -47,15 +48,6 @@ class TimeoutsCog(commands.Cog):
                            (after.timed_out_until is not None) and \
                            (before.timed_out_until < after.timed_out_until)
 
-        duration_to_add = datetime.timedelta(seconds=0)
-        if timeout_applied:
-            duration_to_add = after.timed_out_until - now
-        elif timeout_removed:
-            duration_to_add = now - before.timed_out_until
-        elif timeout_extended:
-            duration_to_add = after.timed_out_until - before.timed_out_until
-
-        # Do not count timeouts by server owner (but do count removals)
         has_changed = timeout_applied or timeout_extended or timeout_removed
 
         if has_changed:
@@ -64,24 +56,56 @@ class TimeoutsCog(commands.Cog):
             moderator = None
             reason = None
 
-            async for entry in after.guild.audit_logs(limit=5, action=discord.AuditLogAction.member_update):
-                if entry.target and entry.target.id == after.id and entry.changes.after and hasattr(entry.changes.after,
-                                                                                                    'timed_out_until'):
-                    moderator = entry.user
-                    reason = entry.reason if entry.reason else "Fun!"
-                    break
-            else:
-                _log.debug("Moderator/Reason not found in recent audit logs.")
-
-            add_to_db = moderator is not None and (moderator != after.guild.owner or timeout_removed) 
-            if add_to_db:
-                await timeout_utils.update_timeout_leaderboard(after.id, duration_to_add.total_seconds())
+            entry = await audit_utils.AUDIT_LOG_CACHE.lookup(after.id)
+            if entry is None:
+                # Not seen on the gateway, ask the API
+                async for e in after.guild.audit_logs(limit=5, action=discord.AuditLogAction.member_update):
+                    if e.target and e.target.id == after.id and e.changes.after and hasattr(e.changes.after,
+                                                                                            'timed_out_until'):
+                        entry = e
+                        break
+                else:
+                    _log.debug("Moderator/Reason not found in recent audit logs.")
+
+            if entry is not None:
+                moderator = entry.user or after.guild.get_member(entry.user_id)
+                reason = entry.reason if entry.reason else "Fun!"
 
             if timeout_applied or timeout_extended:
                 await self.on_member_timeout(after, after.timed_out_until, moderator, reason)
             else:
                 await self.on_member_untimeout(after, moderator, reason)
 
+    @commands.Cog.listener()
+    async def on_audit_log_entry_create(self, entry: discord.AuditLogEntry):
+        """Every new audit-log entry, pushed by the gateway."""
+        if entry.action is not discord.AuditLogAction.member_update:
+            return
+
+        audit_utils.AUDIT_LOG_CACHE.add(entry)
+        if entry.guild.id == bot_utils.Guilds.Default:
+            await timeout_utils.fold_audit_log_entry(entry.guild, entry)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        if member.guild.id == bot_utils.Guilds.Default:
+            await timeout_utils.add_timeout_user(member)
+
+    @commands.Cog.listener()
+    async def on_disconnect(self):
+        # Entries created while disconnected are fetched by the catch-up in on_ready
+        timeout_utils.mark_disconnected()
+        audit_utils.AUDIT_LOG_CACHE.disconnected()
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        # Anything replayed by the resume has been dispatched by now
+        audit_utils.AUDIT_LOG_CACHE.connected()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        audit_utils.AUDIT_LOG_CACHE.connected()
+
     @staticmethod
     async def on_member_timeout(member: discord.Member,
                                 until: datetime.datetime,
@@ -197,6 +221,32 @@ class TimeoutsCog(commands.Cog):
         # Send the final response
         await interaction.followup.send(embed=embed, ephemeral=False)
 
+    @app_commands.command(name='auditstats', description='Audit log cache statistics')
+    async def command_audit_stats(self, interaction: discord.Interaction):
+        if not bot_utils.is_trusted_developer(interaction):
+            return await interaction.response.send_message("No stats 4 U")
+
+        stats = audit_utils.AUDIT_LOG_CACHE.stats()
+        lookups = stats.hits + stats.misses
+        hit_rate = stats.hits / lookups * 100 if lookups else 0.0
+        lines = [
+            f"Cached entries: {stats.size} (expired {stats.expired})",
+            f"Lookups: {lookups}, hits {stats.hits}, misses {stats.misses} ({hit_rate:.1f}% hit rate)",
+        ]
+        await interaction.response.send_message("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+    @app_commands.command(name='rebuild_leaderboard', description='Recount the timeout leaderboard from the whole audit log')
+    @commands.check(bot_utils.is_guild_paradise)
+    async def command_rebuild_leaderboard(self, interaction: discord.Interaction):
+        if not bot_utils.is_trusted_developer(interaction):
+            return await interaction.response.send_message("No rebuild 4 U")
+
+        # Walks the whole audit log history
+        await interaction.response.defer(thinking=True, ephemeral=True)
+
+        members = await timeout_utils.ingest_timeouts(interaction.guild, full=True)
+        await interaction.followup.send(f"Rebuilt the leaderboard for {members} members.", ephemeral=True)
+
     # --- Local Command Error Handler (Overrides the global handler for this cog's commands) ---
 
     async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
@@ -6,7 +6,9 @@ import logging
 
 import utils.bot as bot_utils
 import utils.database as db_utils
+import utils.migrations as migration_utils
 import utils.log as log_utils
+import utils.timeout as timeout_utils
 import utils.stocks.stock_db as stock_utils
 import discord
 import datetime
@@ -65,8 +67,14 @@ class HotReloadBot(commands.Bot):
             bot_utils.defer_message(self, bot_utils.Users.Nathan, message)
 
         server = discord.utils.get(bot.guilds, id=bot_utils.Guilds.Default)
-        leaderboard = await bot_utils.get_timeout_data(server)
-        await db_utils.init_database(leaderboard, stock_utils.AVAILABLE_STOCKS)
+        await db_utils.open_pool(
+            db_utils.DATABASE_NAME,
+            single_writer=True,
+            pragmas=db_utils.PragmaConfig(),
+            group_commit=db_utils.GroupCommitConfig(),
+        )
+        await migration_utils.init_database(stock_utils.AVAILABLE_STOCKS)
+        await timeout_utils.ingest_timeouts(server)
 
         self.tree.error(self._handle_error)
         await self.hot_reload_cogs()
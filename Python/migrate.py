@@ -1,13 +1,13 @@
 import utils.database as database
-import utils.model as model
+import utils.migrations as migrations
 import asyncio
 
 async def migrate():
+    applied = await migrations.run_migrations()
     async with database.Database(database.DATABASE_NAME) as db:
-        await db.drop_table_with_name("timeouts")
-
-        await db.drop_table(model.Purchase)
-        await db.create_table(model.Purchase)
+        version = await migrations.get_database_version(db)
+    print(f"Applied {len(applied)} migration(s), database is at version {version}")
+    await database.close_pool()
 
 
 asyncio.run(migrate())
@@ -14,14 +14,14 @@ async def get_extra_admin_rolls(consume: bool) -> list[int]:
     
 
 async def get_last_admin_roll() -> Optional[Timestamps]:
-    async with Database(DATABASE_NAME) as db:
+    async with Database(DATABASE_NAME, readonly=True) as db:
         return await db.select(Timestamps)
     
     
 async def update_last_admin_roll():
     async with Database(DATABASE_NAME) as db:
         timestamps = await db.select(Timestamps)
-        timestamps.last_roll = datetime.datetime.now()
+        timestamps.last_roll = datetime.datetime.now(datetime.timezone.utc)
         await db.insert_or_update(timestamps)
     
     
@@ -0,0 +1,113 @@
+import asyncio
+import time
+import discord
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+
+#-----------------------------------------------------------------
+#   Recent member_update audit-log entries, fed by the gateway
+#
+#   The gateway sends every new audit-log entry (on_audit_log_entry_create), so looking up who
+#   timed someone out doesn't need a REST call. Member updates usually arrive a moment before
+#   their audit-log entry, so while the feed is live lookups wait briefly for it before reporting
+#   a miss. Updates replayed on a resume may have had their entry sent before we were listening,
+#   so those (and anything while disconnected) miss straight away and go to REST.
+
+@dataclass
+class AuditLogCacheStats:
+    size: int
+    hits: int
+    misses: int
+    expired: int
+
+
+class AuditLogCache:
+    def __init__(self, ttl: float = 120.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.by_target: dict[int, discord.AuditLogEntry] = {}         # newest timeout entry per member
+        self.expiry: deque[tuple[float, int, int]] = deque()           # (expires at, target id, entry id), oldest first
+        self.waiters: dict[int, list[asyncio.Future]] = {}
+        self.live = True  # connected, and getting entries as they are created
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def is_timeout_entry(entry: discord.AuditLogEntry) -> bool:
+        return entry.action is discord.AuditLogAction.member_update and \
+               entry.target is not None and hasattr(entry.changes.after, 'timed_out_until')
+
+    def add(self, entry: discord.AuditLogEntry) -> None:
+        if not self.is_timeout_entry(entry):
+            return
+
+        self._expire()
+        target = entry.target.id
+        self.by_target[target] = entry
+        self.expiry.append((time.monotonic() + self.ttl, target, entry.id))
+        while len(self.expiry) > self.max_entries:
+            self._pop_oldest()
+
+        for waiter in self.waiters.pop(target, []):
+            if not waiter.done():
+                waiter.set_result(entry)
+
+    def connected(self) -> None:
+        self.live = True
+
+    def disconnected(self) -> None:
+        self.live = False
+
+    def get(self, target: int) -> Optional[discord.AuditLogEntry]:
+        """The newest cached timeout entry for `target`, without counting a hit or miss."""
+        self._expire()
+        return self.by_target.get(target)
+
+    async def lookup(self, target: int, wait: float = 2.0) -> Optional[discord.AuditLogEntry]:
+        """
+        The newest timeout entry for `target`, waiting up to `wait` seconds for it to arrive
+        if the feed is live. Counts a hit, or a miss when the caller has to fall back to REST.
+        """
+        entry = self.get(target)
+        if entry is None and wait > 0 and self.live:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.setdefault(target, []).append(waiter)
+            try:
+                entry = await asyncio.wait_for(waiter, wait)
+            except asyncio.TimeoutError:
+                entry = None
+            finally:
+                waiters = self.waiters.get(target)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self.waiters[target]
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def stats(self) -> AuditLogCacheStats:
+        self._expire()
+        return AuditLogCacheStats(size=len(self.by_target), hits=self.hits, misses=self.misses, expired=self.expired)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self.expiry and self.expiry[0][0] <= now:
+            self._pop_oldest()
+            self.expired += 1
+
+    def _pop_oldest(self) -> None:
+        _, target, entry_id = self.expiry.popleft()
+        cached = self.by_target.get(target)
+        if cached is not None and cached.id == entry_id:  # not replaced by a newer entry since
+            del self.by_target[target]
+
+
+# Module level so it survives cog hot reloads
+AUDIT_LOG_CACHE = AuditLogCache()
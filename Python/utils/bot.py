@@ -6,6 +6,7 @@ import asyncio
 import datetime
 import secrets
 from .model import User
+from typing import Optional
 
 
 IS_LIVE = os.path.exists('/.dockerenv')
@@ -202,61 +203,83 @@ class DiscordHandler(logging.Handler):
             print(f"Failed to send error DM: {e}")
 
 
-async def get_timeout_data(guild: discord.Guild | None) -> list[User]:
-    if guild is None:
-        return []
+def timeout_from_audit_entry(guild: discord.Guild, entry: discord.AuditLogEntry) -> Optional[User]:
+    """The count/duration a member_update audit-log entry adds to its target, or None if it doesn't count."""
+    member = guild.get_member(getattr(entry.target, 'id', 0))  # gateway entries may only carry an Object
 
-    leaderboard: list[User] = [User(x.id, 0, 0) for x in guild.members if not x.bot and x.id != guild.owner_id]
+    if member is None:
+        return None
 
-    async for entry in guild.audit_logs(limit=None, action=discord.AuditLogAction.member_update):
-        member = entry.target
+    if member.bot or member.id == guild.owner_id:
+        return None
 
-        if member not in guild.members:
-            continue
+    was_timeout = getattr(entry.changes.before, 'timed_out_until', None)
+    now_timeout = getattr(entry.changes.after, 'timed_out_until', None)
+    was_timeout = was_timeout or datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
+    now_timeout = now_timeout or datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
 
-        if member.bot or member.id == guild.owner_id:
-            continue
+    b_was_timeout = (was_timeout >= entry.created_at)
+    b_now_timeout = (now_timeout >= entry.created_at)
 
-        was_timeout = getattr(entry.changes.before, 'timed_out_until', None)
-        now_timeout = getattr(entry.changes.after, 'timed_out_until', None)
-        was_timeout = was_timeout or datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
-        now_timeout = now_timeout or datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)
+    timeout_added = not b_was_timeout and b_now_timeout
+    timeout_changed = b_was_timeout and b_now_timeout
+    timeout_removed = b_was_timeout and not b_now_timeout
+    
+    if (timeout_added or timeout_changed) and entry.user_id == guild.owner_id:
+        return None
 
-        b_was_timeout = (was_timeout >= entry.created_at)
-        b_now_timeout = (now_timeout >= entry.created_at)
+    if timeout_added:
+        duration = (now_timeout - entry.created_at).total_seconds()
+        return User(member.id, 1, duration)
 
-        timeout_added = not b_was_timeout and b_now_timeout
-        timeout_changed = b_was_timeout and b_now_timeout
-        timeout_removed = b_was_timeout and not b_now_timeout
-        
-        moderator = entry.user
-        if (timeout_added or timeout_changed) and moderator == guild.owner:
-            continue
+    if timeout_changed:
+        duration = (now_timeout - was_timeout).total_seconds()
+        return User(member.id, 0, duration)
 
-        if timeout_added:
-            duration = (now_timeout - entry.created_at).total_seconds()
-            leaderboard.append(User(member.id, 1, duration))
+    if timeout_removed:
+        duration = (entry.created_at - was_timeout).total_seconds()
+        return User(member.id, 0, duration)
 
-        if timeout_changed:
-            duration = (now_timeout - was_timeout).total_seconds()
-            leaderboard.append(User(member.id, 0, duration))
+    return None
 
-        if timeout_removed:
-            duration = (entry.created_at - was_timeout).total_seconds()
-            leaderboard.append(User(member.id, 0, duration))
 
+def accumulate_timeouts(timeouts: list[User]) -> dict[int, User]:
     acc: dict[int, User] = {}
-    for t in leaderboard:
+    for t in timeouts:
         if t.id in acc:
             acc[t.id].count += t.count
             acc[t.id].duration += t.duration
         else:
             acc[t.id] = User(t.id, t.count, t.duration)
+    return acc
+
+
+def untimed_members(guild: discord.Guild) -> list[User]:
+    """A zero leaderboard row for every member who can be on the leaderboard."""
+    return [User(x.id, 0, 0) for x in guild.members if not x.bot and x.id != guild.owner_id]
+
+
+async def get_timeout_data(guild: discord.Guild | None) -> tuple[list[User], int]:
+    """
+    Totals for every member from the guild's whole member_update audit log,
+    and the id of the newest entry read (0 if there were none).
+    """
+    if guild is None:
+        return [], 0
+
+    leaderboard: list[User] = untimed_members(guild)
+    last_entry_id = 0
+
+    async for entry in guild.audit_logs(limit=None, action=discord.AuditLogAction.member_update):
+        last_entry_id = max(last_entry_id, entry.id)
+        timeout = timeout_from_audit_entry(guild, entry)
+        if timeout is not None:
+            leaderboard.append(timeout)
 
     sorted_leaderboard = sorted(
-        acc.values(),
+        accumulate_timeouts(leaderboard).values(),
         key=lambda x: x.count,
         reverse=True
     )
 
-    return sorted_leaderboard
+    return sorted_leaderboard, last_entry_id
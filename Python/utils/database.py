@@ -1,77 +1,37 @@
 import aiosqlite
+import asyncio
 import sqlite3
 import datetime
 import random
 import math
+import time
 from packaging.version import Version
 from .model import *
-from collections import defaultdict
-from dataclasses import dataclass, fields, asdict, Field
-from typing import Optional, Any, Type, get_type_hints, Type, Union
-
-@dataclass
-class WhereParam:
-    field: str
-    value: Any
-    cmp: str = '=' # '=', 'IS', 'IS NOT'
-    
-WhereNode = Union[WhereParam, list[WhereParam]]
-WhereClause = list[WhereNode]
-
-def build_where_clause(where: WhereClause) -> tuple[str, list[object]]:
+from .registry import ModelInfo, model_info, index_info, INDEX_PREFIX
+from .query import WhereParam, WhereNode, WhereClause, Expr, F, Param, Scope, UNSCOPED, compile_where, prepare, prepare_join, Bound, model_scope, join_scope
+from collections import defaultdict, deque
+from functools import lru_cache
+from dataclasses import dataclass, fields, asdict, replace, Field
+from typing import Optional, Any, Type, get_type_hints, Type, Union, Sequence, AsyncIterator
+
+def build_where_clause(where: Union[WhereClause, Expr, None], scope: Union[Scope, Any] = UNSCOPED) -> tuple[str, list[object]]:
     """
     AND between top-level nodes.
     OR inside nested lists.
+    Also takes a predicate built with F(); see utils/query.py.
     """
-    if not where:
-        return "", []
-
-    parts: list[str] = []
-    params: list[object] = []
-
-    for node in where:
-        # Single condition
-        if isinstance(node, WhereParam):
-            fragment, frag_params = _render_param(node)
-            parts.append(fragment)
-            params.extend(frag_params)
-            continue
-
-        # OR-group: list[WhereParam]
-        if not node:  # empty group, skip
-            continue
-
-        or_fragments: list[str] = []
-        for p in node:
-            fragment, frag_params = _render_param(p)
-            or_fragments.append(fragment)
-            params.extend(frag_params)
-
-        parts.append(f"({' OR '.join(or_fragments)})")
-
-    return " WHERE " + " AND ".join(parts), params
-
-def _render_param(p: WhereParam) -> tuple[str, list[object]]:
-    # Handle IS / IS NOT with NULL
-    if p.value is None and p.cmp in ("=", "IS", "IS NOT"):
-        if p.cmp == "=":
-            return f"{p.field} IS NULL", []
-        return f"{p.field} {p.cmp} NULL", []
-
-    return f"{p.field} {p.cmp} ?", [p.value]
+    return compile_where(where, scope)
 
 @dataclass
 class OrderParam:
     field: str
     descending: bool
 
-def _alias_cols(cls: type, alias: str) -> list[str]:
-    return [f'{alias}.{f.name} AS "{alias}.{f.name}"' for f in fields(cls)]
-
-def _row_to(cls: type[T], row: aiosqlite.Row, alias: str) -> T:
-    hints = get_type_hints(cls, include_extras=True)
-    data = {f.name: row[f"{alias}.{f.name}"] for f in fields(cls)}
-    return cls(**data)  # type: ignore[arg-type]
+@dataclass
+class Aggregate:
+    group: tuple            # values of the group_by columns, in order; () when not grouped
+    sums: dict[str, Any]    # column -> SUM, 0 when no rows matched
+    count: int
 
 def _find_relationship(left: type, right: type) -> tuple[str, str, str]:
     """
@@ -79,71 +39,441 @@ def _find_relationship(left: type, right: type) -> tuple[str, str, str]:
     side_with_fk is 'left' or 'right'.
     pk_field defaults to 'id' unless metadata overrides.
     """
-    lt, rt = python_to_table_name(left), python_to_table_name(right)
+    li, ri = model_info(left), model_info(right)
 
     # left has FK → right
-    for f in fields(left):
-        fk = f.metadata.get("fk")
-        if fk and fk["table"] == rt:
-            return ("left", f.name, fk.get("column", "id"))
+    for name, (table, column) in li.fks.items():
+        if table == ri.table:
+            return ("left", name, column)
 
     # right has FK → left
-    for f in fields(right):
-        fk = f.metadata.get("fk")
-        if fk and fk["table"] == lt:
-            return ("right", f.name, fk.get("column", "id"))
+    for name, (table, column) in ri.fks.items():
+        if table == li.table:
+            return ("right", name, column)
 
     raise ValueError(f"No foreign-key relationship between {left.__name__} and {right.__name__}")
 
+# --- joins ---
+@dataclass(frozen=True)
+class LeftJoin:
+    """Wrap a model passed to Database.join to LEFT JOIN it; its place in each result is None when nothing matched."""
+    model: type
+
+@dataclass(frozen=True)
+class JoinPlan:
+    sql: str                                   # SELECT ... FROM ... JOIN ..., no WHERE
+    scope: Scope
+    slices: tuple[tuple[ModelInfo, int, int, bool], ...]  # (model, first column, end column, outer)
+
+    def decode(self, row: Sequence[Any]) -> tuple:
+        row = tuple(row)
+        out = []
+        for info, start, end, outer in self.slices:
+            values = row[start:end]
+            if outer and all(v is None for v in values):
+                out.append(None)
+            else:
+                out.append(info.from_row(values))
+        return tuple(out)
+
+@lru_cache(maxsize=None)
+def join_plan(*sides: tuple[str, type, bool]) -> JoinPlan:
+    """
+    Compile a join of (alias, model, outer) sides, done once per join shape.
+    Each side after the first joins on a foreign key to an earlier side.
+    """
+    columns: list[str] = []
+    slices = []
+    clauses = []
+    for i, (alias, model, outer) in enumerate(sides):
+        info = model_info(model)
+        slices.append((info, len(columns), len(columns) + len(info.names), outer))
+        columns += info.aliased_keys(alias)
+
+        if i == 0:
+            clauses.append(f"FROM {info.table} {alias}")
+            continue
+
+        for other_alias, other, _ in sides[:i]:
+            try:
+                side, fk_field, pk_field = _find_relationship(model, other)
+            except ValueError:
+                continue
+            if side == "left":
+                on = f"{alias}.{fk_field} = {other_alias}.{pk_field}"
+            else:
+                on = f"{alias}.{pk_field} = {other_alias}.{fk_field}"
+            break
+        else:
+            raise ValueError(f"No foreign-key relationship between {model.__name__} and {', '.join(m.__name__ for _, m, _ in sides[:i])}")
+        clauses.append(f"{'LEFT' if outer else 'INNER'} JOIN {info.table} {alias} ON {on}")
+
+    return JoinPlan(
+        sql=f"SELECT {', '.join(columns)} " + " ".join(clauses),
+        scope=join_scope(*((alias, model) for alias, model, _ in sides)),
+        slices=tuple(slices),
+    )
+
+# --- sqlite type adapters (process-wide, registered once) ---
+aiosqlite.register_adapter(datetime.datetime, lambda d: d.isoformat(timespec="seconds"))
+
+def _convert_datetime(b: bytes) -> datetime.datetime:
+    # epoch_datetime() columns hold integer microseconds; everything else ISO-8601 text
+    if b.isdigit() or b[:1] == b"-":
+        return from_epoch_us(int(b))
+    return datetime.datetime.fromisoformat(b.decode())
+
+aiosqlite.register_converter("DATETIME", _convert_datetime)
+
+aiosqlite.register_adapter(Version, lambda v: v.__str__())
+aiosqlite.register_converter("VERSION", lambda v: Version(v.decode()))
+
+aiosqlite.register_adapter(bool, int)  # True->1, False->0
+aiosqlite.register_converter(
+    "BOOLEAN", lambda b: b.strip().lower() in (b"1", b"t", b"true", b"y", b"yes")
+)
+
+@dataclass
+class PragmaConfig:
+    journal_mode: str = "WAL"
+    # NORMAL is safe with WAL but doesn't sync on commit, so the last commits can be lost on power
+    # failure. None means NORMAL, or FULL under group commit, whose units resolve once on disk.
+    synchronous: Optional[str] = None
+    cache_size: int = -16000        # negative = KiB
+    mmap_size: int = 64 * 1024 * 1024
+    busy_timeout: int = 5000        # ms
+
+    def statements(self, readonly: bool = False) -> list[str]:
+        pragmas = [
+            f"PRAGMA busy_timeout = {int(self.busy_timeout)}",
+            f"PRAGMA synchronous = {self.synchronous or 'NORMAL'}",
+            f"PRAGMA cache_size = {int(self.cache_size)}",
+            f"PRAGMA mmap_size = {int(self.mmap_size)}",
+        ]
+        # journal_mode is persistent and needs write access, so only writers set it
+        if not readonly:
+            pragmas.insert(0, f"PRAGMA journal_mode = {self.journal_mode}")
+        return pragmas
+
+async def _open_connection(path: str, pragmas: Optional[PragmaConfig] = None, readonly: bool = False) -> aiosqlite.Connection:
+    if readonly:
+        con = await aiosqlite.connect(f"file:{path}?mode=ro", uri=True, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    else:
+        con = await aiosqlite.connect(path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    con.row_factory = aiosqlite.Row
+
+    if pragmas:
+        for pragma in pragmas.statements(readonly):
+            await con.execute(pragma)
+    return con
+
+# --- connection pool ---
+@dataclass
+class PoolStats:
+    size: int
+    idle: int
+    in_use: int
+    waiting: int
+    checkouts: int
+    total_wait: float   # seconds spent waiting for a free connection, summed over checkouts
+    max_wait: float
+
+class ConnectionPool:
+    """
+    Bounded set of warm connections, opened once and handed out per unit of work.
+    Waiters are served in FIFO order once a connection is returned.
+    """
+    def __init__(self, path: str, size: int = 4, pragmas: Optional[PragmaConfig] = None, readonly: bool = False):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self.readonly = readonly
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._connections: list[aiosqlite.Connection] = []
+        self._waiting = 0
+        self._checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def open(self) -> "ConnectionPool":
+        while len(self._connections) < self.size:
+            con = await _open_connection(self.path, self.pragmas, self.readonly)
+            self._connections.append(con)
+            self._idle.put_nowait(con)
+        return self
+
+    async def close(self) -> None:
+        connections, self._connections = self._connections, []
+        self._idle = asyncio.Queue()
+        for con in connections:
+            try: await con.close()
+            except aiosqlite.Error: pass
+
+    async def acquire(self) -> aiosqlite.Connection:
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            con = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        waited = time.perf_counter() - start
+        self._checkouts += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        return con
+
+    async def release(self, con: aiosqlite.Connection, keep_transaction: bool = False) -> None:
+        if con not in self._connections:
+            # Pool was closed while this connection was checked out
+            await con.close()
+            return
+
+        # Never hand out a connection with a half-finished transaction,
+        # unless it is a group-commit batch that the next writer will carry on
+        if con.in_transaction and not keep_transaction:
+            try: await con.rollback()
+            except aiosqlite.Error: pass
+        self._idle.put_nowait(con)
+
+    def stats(self) -> PoolStats:
+        idle = self._idle.qsize()
+        return PoolStats(
+            size=len(self._connections),
+            idle=idle,
+            in_use=len(self._connections) - idle,
+            waiting=self._waiting,
+            checkouts=self._checkouts,
+            total_wait=self._total_wait,
+            max_wait=self._max_wait,
+        )
+
+# --- group commit ---
+@dataclass
+class GroupCommitConfig:
+    max_batch: int = 64         # commit once this many writes are waiting...
+    max_delay_ms: float = 20    # ...or once the oldest has waited this long
+
+@dataclass
+class GroupCommitStats:
+    commits: int
+    writes: int
+    commits_per_second: float   # over the last STATS_WINDOW seconds
+    batch_sizes: dict[int, int] # power-of-two upper bound -> number of commits
+
+class GroupCommitter:
+    """
+    Collects `Database(path, group_commit=True)` units on the single writer
+    connection into one open transaction and commits them together.
+
+    Each unit runs inside its own SAVEPOINT, so a failing unit only rolls back
+    its own statements. A unit's future resolves once the batch holding it has
+    been committed, which is durable with synchronous=FULL (open_pool's default here).
+    """
+    STATS_WINDOW = 60.0
+
+    def __init__(self, pool: ConnectionPool, config: GroupCommitConfig):
+        self.pool = pool
+        self.config = config
+        self._pending: list[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._commits = 0
+        self._writes = 0
+        self._commit_times: deque[float] = deque()
+        self._batch_sizes: dict[int, int] = defaultdict(int)
+
+    async def begin(self, con: aiosqlite.Connection) -> None:
+        if not con.in_transaction:
+            await con.execute("BEGIN")
+        await con.execute("SAVEPOINT group_unit")
+
+    async def end(self, con: aiosqlite.Connection, failed: bool) -> Optional[asyncio.Future]:
+        if failed:
+            try:
+                await con.execute("ROLLBACK TO group_unit")
+                await con.execute("RELEASE group_unit")
+                # Don't keep the write lock for a batch that holds nothing
+                if not self._pending:
+                    await con.rollback()
+            except aiosqlite.Error: pass
+            return None
+
+        await con.execute("RELEASE group_unit")
+
+        loop = asyncio.get_running_loop()
+        durable = loop.create_future()
+        self._pending.append(durable)
+
+        if len(self._pending) >= self.config.max_batch:
+            await self.flush(con)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.config.max_delay_ms / 1000, self._on_timer)
+        return durable
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._flush_task = asyncio.ensure_future(self._flush_from_timer())
+
+    async def _flush_from_timer(self) -> None:
+        con = await self.pool.acquire()
+        try:
+            await self.flush(con)
+        finally:
+            await self.pool.release(con)
+
+    async def flush(self, con: aiosqlite.Connection) -> None:
+        """
+        Commit whatever batch is open on the writer. Never raises: a failed commit
+        is handed to the futures of the writes it contained.
+        """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, []
+        try:
+            if con.in_transaction:
+                await con.commit()
+        except BaseException as e:
+            try: await con.rollback()
+            except aiosqlite.Error: pass
+            for durable in pending:
+                if not durable.done():
+                    durable.set_exception(e)
+            return
+
+        for durable in pending:
+            if not durable.done():
+                durable.set_result(None)
+
+        if pending:
+            now = time.monotonic()
+            self._commits += 1
+            self._writes += len(pending)
+            self._commit_times.append(now)
+            self._batch_sizes[1 << (len(pending) - 1).bit_length()] += 1
+
+    def stats(self) -> GroupCommitStats:
+        cutoff = time.monotonic() - self.STATS_WINDOW
+        while self._commit_times and self._commit_times[0] < cutoff:
+            self._commit_times.popleft()
+
+        return GroupCommitStats(
+            commits=self._commits,
+            writes=self._writes,
+            commits_per_second=len(self._commit_times) / self.STATS_WINDOW,
+            batch_sizes=dict(sorted(self._batch_sizes.items())),
+        )
+
+@dataclass
+class DatabasePool:
+    """
+    Connections for one database file.
+
+    Shared mode: `writer` holds every connection and serves all units of work.
+    Single-writer mode: `writer` holds exactly one read/write connection, so
+    mutations queue up behind each other, while read-only units are served by
+    `readers` without contending for it.
+    """
+    writer: ConnectionPool
+    readers: Optional[ConnectionPool] = None
+    committer: Optional[GroupCommitter] = None
+
+    def for_unit(self, readonly: bool) -> ConnectionPool:
+        return self.readers if (readonly and self.readers) else self.writer
+
+    async def close(self) -> None:
+        if self.committer:
+            con = await self.writer.acquire()
+            await self.committer.flush(con)
+            await self.writer.release(con)
+        await self.writer.close()
+        if self.readers:
+            await self.readers.close()
+
+_POOLS: dict[str, DatabasePool] = {}
+
 # --- core ORM ---
 class Database:
-    def __init__(self, path: str, defer_commit: bool = False):
+    def __init__(self, path: str, defer_commit: bool = False, readonly: bool = False, group_commit: bool = False):
         self.path = path
         self.defer_commit = defer_commit
+        self.readonly = readonly  # select/join_select only; served by a reader connection when one is open
+        self.group_commit = group_commit  # batch with other writes; __aexit__ waits until the batch is durable
+        self.pool: Optional[ConnectionPool] = None
+        self.committer: Optional[GroupCommitter] = None
+
+    async def _acquire(self) -> None:
+        # Borrow from the pool when one is open for this path, otherwise use a private connection
+        pools = _POOLS.get(self.path)
+        self.pool = pools.for_unit(self.readonly) if pools else None
+        self.committer = None
+        if self.pool is None:
+            self.con = await _open_connection(self.path)
+            return
 
-        aiosqlite.register_adapter(datetime.datetime, lambda d: d.isoformat(timespec="seconds"))
-        aiosqlite.register_converter("DATETIME", lambda b: datetime.datetime.fromisoformat(b.decode()))
-        
-        aiosqlite.register_adapter(Version, lambda v: v.__str__())
-        aiosqlite.register_converter("VERSION", lambda v: Version(v.decode()))
-        
-        aiosqlite.register_adapter(bool, int)  # True->1, False->0
-        aiosqlite.register_converter(
-            "BOOLEAN", lambda b: b.strip().lower() in (b"1", b"t", b"true", b"y", b"yes")
-)
+        self.con = await self.pool.acquire()
+        if pools.committer is None or self.pool is not pools.writer:
+            return
+
+        try:
+            if self.group_commit and not self.defer_commit:
+                self.committer = pools.committer
+                await self.committer.begin(self.con)
+            else:
+                # Anything else on the writer must neither join nor roll back an open batch
+                await pools.committer.flush(self.con)
+        except BaseException:
+            self.committer = None
+            await self.pool.release(self.con)
+            raise
+
+    async def _release(self) -> None:
+        if self.pool:
+            await self.pool.release(self.con)
+        else:
+            await self.con.close()
 
     async def connect(self):
-        self.con = await aiosqlite.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
-        self.con.row_factory = aiosqlite.Row
+        await self._acquire()
         return self
         
     async def commit(self) -> None:
-        await self.con.commit()
-        await self.con.close()
+        try: await self.con.commit()
+        finally: await self._release()
 
     async def rollback(self) -> None:
-        await self.con.rollback()
-        await self.con.close()
+        try: await self.con.rollback()
+        finally: await self._release()
 
     async def __aenter__(self):
-        self.con = await aiosqlite.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
-        self.con.row_factory = aiosqlite.Row
+        await self._acquire()
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
         if self.defer_commit:
             return
 
+        if self.committer:
+            try:
+                durable = await self.committer.end(self.con, failed=exc_type is not None)
+            finally:
+                await self.pool.release(self.con, keep_transaction=True)
+            if durable:
+                await durable
+            return
+
         if exc_type:
             try: await self.con.rollback()
             except aiosqlite.Error: pass
         else:
             try: await self.con.commit()
             except aiosqlite.Error: pass
-        await self.con.close()
+        await self._release()
 
-    async def execute(self, query: str) -> aiosqlite.Cursor:
-        return await self.con.execute(query)
+    async def execute(self, query: str, params: Sequence[Any] = ()) -> aiosqlite.Cursor:
+        return await self.con.execute(query, params)
 
     async def executescript(self, query: str) -> aiosqlite.Cursor:
         return await self.con.executescript(query)
@@ -153,7 +483,7 @@ class Database:
         await self.con.execute(sql)
 
     async def drop_table(self, model: Type[T]) -> None:
-        await self.drop_table_with_name(python_to_table_name(model))
+        await self.drop_table_with_name(model_info(model).table)
 
     async def table_exists(self, table_name: str) -> bool:
         cur = await self.con.execute(
@@ -163,155 +493,443 @@ class Database:
         return (await cur.fetchone()) is not None
 
     async def create_single_value_table(self, model: Type[T]):
-        cols = []
-        hints = get_type_hints(model)
-        for f in fields(model):
-            if f.name == "__single_value_table__":
-                continue
-            typename = hints[f.name]
-            sql_type = python_to_sql_type(typename)
-            cols.append(f"{f.name} {sql_type}{'' if is_nullable(typename) else ' NOT NULL'}")
+        info = model_info(model)
+        cols = [f"{c.name} {c.sql_type}{'' if c.nullable else ' NOT NULL'}" for c in info.columns]
         cols.append("guard INTEGER NOT NULL DEFAULT 0 CHECK (guard = 0)")
         sql = (
-            f"CREATE TABLE IF NOT EXISTS {python_to_table_name(model)} "
+            f"CREATE TABLE IF NOT EXISTS {info.table} "
             f"({', '.join(cols)}, UNIQUE(guard))"
         )
         await self.con.execute(sql)
         return
     
     async def create_id_table(self, model: Type[T]):
+        info = model_info(model)
         cols = []
-        hints = get_type_hints(model)
-        for f in fields(model):
-            meta = f.metadata
-            sql_type = python_to_sql_type(hints[f.name])
-            col_def = f"{f.name} {sql_type}"
-            if f.name == "id":
+        for c in info.columns:
+            col_def = f"{c.name} {c.sql_type}"
+            if c.name == "id":
                 col_def += " PRIMARY KEY"
                 
-            if "fk" in meta:
-                fk = meta["fk"]
-                fk_table = fk["table"]
-                fk_field = fk.get("column", "id")
+            if c.fk:
+                fk_table, fk_field = c.fk
                 col_def += f" REFERENCES {fk_table}({fk_field})"
 
             cols.append(col_def)
             
-        sql = f"CREATE TABLE IF NOT EXISTS {python_to_table_name(model)} ({', '.join(cols)})"
+        sql = f"CREATE TABLE IF NOT EXISTS {info.table} ({', '.join(cols)})"
         await self.con.execute(sql)
 
-    async def create_table(self, model: Type[T]) -> bool:
-        exists = await self.table_exists(python_to_table_name(model))
+    async def create_table(self, model: Type[T], indexes: bool = True) -> bool:
+        """Create `model`'s table, with its declared indexes unless `indexes` is False. Returns whether it was new."""
+        info = model_info(model)
+        exists = await self.table_exists(info.table)
         if exists:
             return False
 
-        is_single = getattr(model, "__single_value_table__", False)
-        if is_single:
+        if info.is_single:
             await self.create_single_value_table(model)
         else:
             await self.create_id_table(model)
+            if indexes:
+                await self.create_indexes(model)
 
         return True
 
-    async def insert(self, obj: T) -> int:
-        is_single = getattr(type(obj), "__single_value_table__", False)
-        data = asdict(obj)
+    async def create_indexes(self, model: Type[T]) -> None:
+        for index in model_info(model).indexes:
+            await self.con.execute(index.create_sql)
+
+    async def reconcile_indexes(self, models: Union[list[type], dict[type, list[tuple[str, ...]]]]) -> tuple[list[str], list[str]]:
+        """
+        Bring the declared indexes of `models` in line with the database:
+        create missing ones and drop managed (ix_*) ones no longer declared.
+        `models` may map each model to the column tuples to index instead of its declarations.
+        Returns (created, dropped) index names.
+        """
+        created: list[str] = []
+        dropped: list[str] = []
+        for model in models:
+            info = model_info(model)
+            indexes = [index_info(info.table, cols) for cols in models[model]] if isinstance(models, dict) else info.indexes
+            cur = await self.con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                (info.table,),
+            )
+            existing = {row[0] for row in await cur.fetchall()}
+            declared = {index.name for index in indexes}
+
+            for index in indexes:
+                if index.name not in existing:
+                    await self.con.execute(index.create_sql)
+                    created.append(index.name)
+
+            for name in sorted(existing - declared):
+                if name.startswith(INDEX_PREFIX):
+                    await self.con.execute(f"DROP INDEX IF EXISTS {name}")
+                    dropped.append(name)
+
+        return created, dropped
+
+    async def install_balance_triggers(self) -> None:
+        """(Re)create the triggers that keep `balances` in step with every CREDIT_LEDGER write."""
+        cur = await self.con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?",
+            (f"{BALANCE_TRIGGER_PREFIX}%",),
+        )
+        for (name,) in await cur.fetchall():
+            await self.con.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for sql in balance_trigger_sql():
+            await self.con.execute(sql)
+
+    async def rebuild_balances(self) -> None:
+        """Recompute every balance from the ledger tables."""
+        await self.con.execute(f"DELETE FROM {model_info(Balance).table}")
+        await self.con.execute(f"INSERT INTO {model_info(Balance).table} (id, credit) {LEDGER_CREDIT_SQL}")
+
+    async def balance_drift(self) -> list[tuple[int, Optional[float], Optional[float]]]:
+        """
+        Compare stored balances against the ledger.
+        Returns (user_id, stored, expected) for every user that differs; None where a row is missing.
+        """
+        cur = await self.con.execute(LEDGER_CREDIT_SQL)
+        expected = dict(await cur.fetchall())
+        stored = { user_id: credit async for user_id, credit in self.stream(Balance, columns=("id", "credit")) }
+
+        drift = []
+        for user_id in sorted(expected.keys() | stored.keys()):
+            a, b = stored.get(user_id), expected.get(user_id)
+            if a is None or b is None or not math.isclose(a, b, abs_tol=1e-6):
+                drift.append((user_id, a, b))
+        return drift
+
+    async def encode_epoch_datetimes(self, model: type, column: str, limit: int) -> int:
+        """Rewrite up to `limit` ISO-text values of an epoch_datetime() column as integers. Returns how many."""
+        info = model_info(model)
+        info.check_field(column)
+        cur = await self.con.execute(f"SELECT rowid, {column} FROM {info.table} WHERE typeof({column}) = 'text' LIMIT ?", (limit,))
+        rows = await cur.fetchall()
+        await self.con.executemany(
+            f"UPDATE {info.table} SET {column} = ? WHERE rowid = ?",
+            [(to_epoch_us(value), rowid) for rowid, value in rows],
+        )
+        return len(rows)
+
+    async def spend(self, user_id: int, amount: float, record: T) -> bool:
+        """
+        Insert `record` only if `user_id` has at least `amount` credit, checking and
+        writing under one write lock so concurrent spends can't both pass the check.
+        A user with no balances row has no credit, so can still spend nothing.
+        Returns whether the record was inserted.
+        """
+        if not self.con.in_transaction:
+            # Take the write lock before reading the balance, not at the insert
+            await self.con.execute("BEGIN IMMEDIATE")
+
+        cur = await self.con.execute(f"SELECT credit FROM {model_info(Balance).table} WHERE id = ?", (user_id,))
+        row = await cur.fetchone()
+        if (row[0] if row else 0.0) < amount:
+            return False
+
+        await self.insert(record)
+        return True
+
+    async def insert(self, obj: T, returning: bool = False) -> Union[int, T]:
+        """
+        Insert `obj`, assigning a generated id back to it. Returns the id,
+        or with `returning` the row as stored (defaults and triggers applied).
+        """
+        info = model_info(type(obj))
+        values = info.values(obj)
         
-        if is_single:
+        if info.is_single:
             # Insert once only. If a row already exists the UNIQUE(guard) constraint fires.
-            table = python_to_table_name(type(obj))
-            keys = ", ".join(data.keys())            # do NOT include `guard`; default 0 will be used
-            qs   = ", ".join("?" for _ in data)
-            sql  = f"INSERT INTO {table} ({keys}) VALUES ({qs})"
+            # `guard` is not a column of the model, so its default 0 is used
+            sql = info.insert_sql(info.names)
             try:
-                await self.con.execute(sql, tuple(data.values()))
+                cur = await self.con.execute(sql + info.returning_sql if returning else sql, values)
             except aiosqlite.IntegrityError as e:
                 # Violates UNIQUE(guard) → singleton already exists
-                raise ValueError(f"Insert refused: {table} already has a row") from e
-            return 1
+                raise ValueError(f"Insert refused: {info.table} already has a row") from e
+            return info.from_row(await cur.fetchone()) if returning else 1
 
         # Treat missing/None/0 as "no id provided"
-        unset = ("id" not in data) or (data.get("id") is None) or (data.get("id") == 0)
-        if unset and "id" in data:
-            data.pop("id")
-
-        keys = ", ".join(data.keys())
-        qs = ", ".join("?" for _ in data)
-        sql = f"INSERT INTO {python_to_table_name(type(obj))} ({keys}) VALUES ({qs})"
-        cur = await self.con.execute(sql, tuple(data.values()))
+        keys = info.names
+        unset = (not info.has_id) or (getattr(obj, "id") is None) or (getattr(obj, "id") == 0)
+        if unset and info.has_id:
+            idx = keys.index("id")
+            keys = keys[:idx] + keys[idx + 1:]
+            values.pop(idx)
+
+        sql = info.insert_sql(keys)
+        if returning:
+            cur = await self.con.execute(sql + info.returning_sql, values)
+            row = info.from_row(await cur.fetchone())
+            if unset and info.has_id:
+                setattr(obj, "id", row.id)
+            info.snapshot(obj)
+            return row
+
+        cur = await self.con.execute(sql, values)
 
         # If id was auto-generated, propagate it to the object and return it
         if unset:
             new_id = cur.lastrowid
             try:
-                if hasattr(obj, "id"):
+                if info.has_id:
                     setattr(obj, "id", new_id)
             except Exception:
                 pass
+            info.snapshot(obj)
             return new_id # type: ignore[return-value]
+
+        info.snapshot(obj)
         
-        return int(getattr(obj, "id")) if hasattr(obj, "id") else 1
+        return int(getattr(obj, "id")) if info.has_id else 1
+
+    async def insert_many(self, objs: Sequence[T]) -> list[int]:
+        """
+        Insert rows of one model with executemany. Objects without an id get the
+        generated one assigned back. Returns the ids in input order.
+        """
+        if not objs:
+            return []
 
+        info = model_info(type(objs[0]))
+        if info.is_single:
+            raise ValueError(f"Bulk insert refused: {info.table} is a single value table")
+        if not info.has_id:
+            await self.con.executemany(info.insert_sql(info.names), [info.values(o) for o in objs])
+            return [1] * len(objs)
 
-    async def select(self, model: Type[T], where: Optional[WhereClause] = None, order: list[OrderParam] = [], limit: Optional[int] = None) -> Union[T, list[T]]:
-        if where is None:
-            where = []
+        # Treat None/0 as "no id provided", same as insert()
+        given = [o for o in objs if getattr(o, "id") not in (None, 0)]
+        unset = [o for o in objs if getattr(o, "id") in (None, 0)]
 
-        is_single = getattr(model, "__single_value_table__", False)
+        if given:
+            await self.con.executemany(info.insert_sql(info.names), [info.values(o) for o in given])
 
-        # validate column name
-        valid_fields = {f.name for f in fields(model)}
+        if unset:
+            keys = tuple(k for k in info.names if k != "id")
+            idx = info.names.index("id")
+            rows = []
+            for o in unset:
+                values = info.values(o)
+                values.pop(idx)
+                rows.append(values)
+            await self.con.executemany(info.insert_sql(keys), rows)
+
+            # The write lock is held from the first row, so the rowids handed out are
+            # consecutive and end at last_insert_rowid()
+            cur = await self.con.execute("SELECT last_insert_rowid()")
+            last_id = (await cur.fetchone())[0]
+            for new_id, o in zip(range(last_id - len(unset) + 1, last_id + 1), unset):
+                setattr(o, "id", new_id)
+
+        for o in objs:
+            info.snapshot(o)
+        return [int(getattr(o, "id")) for o in objs]
+
+    async def insert_missing(self, objs: Sequence[T]) -> None:
+        """Insert the rows whose primary key isn't taken yet; existing rows are left alone. Every object must carry its id."""
+        if not objs:
+            return
 
-        sql = f"SELECT * FROM {python_to_table_name(model)}"
+        info = model_info(type(objs[0]))
+        await self.con.executemany(info.insert_missing_sql(info.names), [info.values(o) for o in objs])
 
-        where_sql, params = build_where_clause(where)
+    async def upsert_many(self, objs: Sequence[T], where: Optional[WhereClause] = None) -> list[int]:
+        """
+        insert_or_update for many rows of one model, as a single executemany.
+        Every object must carry its primary key. Returns the ids in input order.
+        """
+        if not objs:
+            return []
+
+        info = model_info(type(objs[0]))
+        where_sql, where_params = build_where_clause(where, model_scope(info.model))
+        sql = info.upsert_sql(info.names, where_sql)
+        await self.con.executemany(sql, [info.values(o) + where_params for o in objs])
+        return [int(getattr(o, "id")) if info.has_id else 1 for o in objs]
+
+
+    def _select_sql(
+        self,
+        info: ModelInfo,
+        where: Optional[WhereClause],
+        order: list[OrderParam],
+        limit: Optional[int],
+        offset: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> tuple[str, list[object]]:
+        sql = info.projection_sql(tuple(columns)) if columns else info.select_sql
+
+        scope = model_scope(info.model)
+        where_sql, params = build_where_clause(where, scope)
         sql += where_sql
 
         for idx, param in enumerate(order):
             sql += " ORDER BY " if idx == 0 else ", "
-            sql += f"{param.field} {'DESC' if param.descending else ''}"
+            sql += f"{scope.resolve(param.field)} {'DESC' if param.descending else 'ASC'}"
+
+        if limit is not None or offset is not None:
+            sql += " LIMIT ?"
+            params.append(-1 if limit is None else limit)
+        if offset is not None:
+            sql += " OFFSET ?"
+            params.append(offset)
+        return sql, params
+
+    async def select(self, model: Type[T], where: Optional[WhereClause] = None, order: list[OrderParam] = [], limit: Optional[int] = None) -> Union[T, list[T]]:
+        info = model_info(model)
+        sql, params = self._select_sql(info, where, order, limit or None)
 
         cur = await self.con.execute(sql, params)
-        results = await cur.fetchmany(limit) if limit else await cur.fetchall()
-        results = [dict(row) for row in results]
+        results = [info.from_row(row) for row in await cur.fetchall()]
+        return results[0] if info.is_single else results
 
-        if is_single:
-            for row in results:
-                row.pop("guard")
+    async def stream(
+        self,
+        model: Type[T],
+        where: Optional[WhereClause] = None,
+        order: list[OrderParam] = [],
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+        chunk_size: int = 256,
+    ) -> AsyncIterator[Union[T, tuple]]:
+        """
+        Lazily yield the rows of a select, fetching `chunk_size` at a time.
+        With `columns` only those are selected and each row is a plain tuple in that order.
+        The unit must stay open while iterating.
+        """
+        info = model_info(model)
+        sql, params = self._select_sql(info, where, order, limit, offset, columns)
 
-        results = [model(**row) for row in results]
-        return results[0] if is_single else results
+        cur = await self.con.execute(sql, params)
+        try:
+            while rows := await cur.fetchmany(chunk_size):
+                if columns:
+                    for row in rows:
+                        yield tuple(row)
+                else:
+                    for row in rows:
+                        yield info.from_row(row)
+        finally:
+            await cur.close()
+
+    async def aggregate(
+        self,
+        model: Type[T],
+        sum: Sequence[str] = (),
+        count: bool = False,
+        group_by: Sequence[str] = (),
+        where: Optional[WhereClause] = None,
+    ) -> list[Aggregate]:
+        """
+        SUM/COUNT computed by SQLite. Without group_by there is always exactly one
+        result, even when nothing matched.
+        """
+        info = model_info(model)
+        for name in (*sum, *group_by):
+            info.check_field(name)
 
-    async def update(self, obj: T, where: Optional[WhereClause] = None) -> None:
-        if where is None:
-            where = []
+        cols = list(group_by)
+        cols += [f"COALESCE(SUM({name}), 0)" for name in sum]
+        cols.append("COUNT(*)" if count else "0")
 
-        data = asdict(obj)
-        data = {k: v for k, v in data.items() if v is not None}
+        sql = f"SELECT {', '.join(cols)} FROM {info.table}"
+        where_sql, params = build_where_clause(where, model_scope(model))
+        sql += where_sql
+        if group_by:
+            sql += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
 
-        assigns = ", ".join(f"{k}=?" for k in data.keys())
-        sql = f"UPDATE {python_to_table_name(type(obj))} SET {assigns}"
+        cur = await self.con.execute(sql, params)
+        n_group, n_sum = len(group_by), len(sum)
+        return [
+            Aggregate(
+                group=tuple(row[:n_group]),
+                sums=dict(zip(sum, row[n_group:n_group + n_sum])),
+                count=row[n_group + n_sum],
+            )
+            for row in await cur.fetchall()
+        ]
+
+    async def update(self, obj: T, where: Optional[WhereClause] = None, returning: bool = False) -> Optional[list[T]]:
+        """
+        Write the non-None fields of `obj` (matched by id when it has one).
+        A bound prepared predicate is used as is, so it must match the id itself.
+        Objects of @track_changes models loaded from the database only write the fields
+        changed since, and are skipped if there are none.
+        With `returning`, returns the updated rows as stored; empty if nothing was written.
+        """
+        if not isinstance(where, (Expr, Bound)):
+            where = list(where) if where else []
+
+        info = model_info(type(obj))
+        changed = info.changed(obj)
+        if changed is None:
+            pairs = [(k, v) for k, v in zip(info.names, info.values(obj)) if v is not None]
+        elif changed:
+            pairs = [(k, info.adapt(k, getattr(obj, k))) for k in changed]
+        else:
+            return [] if returning else None
+        keys = tuple(k for k, _ in pairs)
+        values = [v for _, v in pairs]
+
+        sql = info.update_sql(keys)
         
-        id_set = ("id" in data) and (data.get("id") is not None) and (data.get("id") != 0)
-        if id_set:
-            where += [WhereParam("id", data.get("id"))]
+        obj_id = getattr(obj, "id", None) if info.has_id else None
+        id_set = (obj_id is not None) and (obj_id != 0)
+        if id_set and where.__class__ is not Bound:
+            where = where & (F("id") == obj_id) if isinstance(where, Expr) else where + [WhereParam("id", obj_id)]
         
-        where_sql, where_params = build_where_clause(where)
+        where_sql, where_params = build_where_clause(where, model_scope(type(obj)))
         sql += where_sql
 
-        await self.con.execute(sql, list(data.values()) + where_params)
-
-    async def delete(self, model: Type[T], where: Optional[WhereClause] = None) -> None:
+        if returning:
+            cur = await self.con.execute(sql + info.returning_sql, values + where_params)
+            rows = [info.from_row(row) for row in await cur.fetchall()]
+            written = bool(rows)
+        else:
+            cur = await self.con.execute(sql, values + where_params)
+            written = cur.rowcount > 0
+        if written:
+            info.snapshot(obj)
+        return rows if returning else None
+
+    async def delete(self, model: Type[T], where: Optional[WhereClause] = None, returning: bool = False) -> Optional[list[T]]:
+        """Delete matching rows. With `returning`, returns the rows that were deleted."""
         if where is None:
             where = []
 
-        sql = f"DELETE FROM {python_to_table_name(model)}"
+        info = model_info(model)
+        sql = f"DELETE FROM {info.table}"
         
-        where_sql, where_params = build_where_clause(where)
+        where_sql, where_params = build_where_clause(where, model_scope(model))
         sql += where_sql
 
+        if returning:
+            cur = await self.con.execute(sql + info.returning_sql, where_params)
+            return [info.from_row(row) for row in await cur.fetchall()]
         await self.con.execute(sql, where_params)
 
+    async def increment(self, model: Type[T], key: int, **deltas: float) -> T:
+        """
+        Add `deltas` onto the row with id `key` in one statement, e.g.
+        increment(User, user_id, count=1, duration=30). A missing row is inserted
+        with the deltas as its values. Returns the row as stored afterwards.
+        """
+        info = model_info(model)
+        if info.is_single or not info.has_id:
+            raise ValueError(f"Increment refused: {info.table} has no id")
+        if not deltas:
+            raise ValueError("Increment needs at least one field")
+
+        keys = tuple(deltas)
+        cur = await self.con.execute(info.increment_sql(keys), [key] + [info.adapt(k, deltas[k]) for k in keys])
+        return info.from_row(await cur.fetchone())
+
     async def insert_or_update(self, obj: T, where: Optional[WhereClause] = None) -> int:
         """
         Insert a row. If a row with the same primary key exists, update it instead.
@@ -320,40 +938,56 @@ class Database:
         if where is None:
             where = []
 
-        is_single = getattr(type(obj), "__single_value_table__", False)
-        data = asdict(obj)
-        table = python_to_table_name(type(obj))
-        keys = list(data.keys())
-        non_keys = keys.copy()
-
-        if is_single:
-            set_clause = ", ".join(f"{k}=excluded.{k}" for k in non_keys)
-            sql = (
-                f"INSERT INTO {table} ({', '.join(keys)}) VALUES ({', '.join('?' for _ in keys)}) "
-                f"ON CONFLICT(guard) DO UPDATE SET {set_clause}"
-            )
-            await self.con.execute(sql, [data[k] for k in keys])
-            return 1
+        info = model_info(type(obj))
+        values = info.values(obj)
 
-        non_id = [k for k in keys if k != "id"]
-        columns = ", ".join(keys)
-        placeholders = ", ".join("?" for _ in keys)
+        if info.is_single:
+            await self.con.execute(info.upsert_sql(info.names), values)
+            return 1
 
         # update to incoming values (excluded.*)
-        set_clause = ", ".join(f"{k}=excluded.{k}" for k in non_id)
+        where_sql, where_params = build_where_clause(where, model_scope(type(obj)))
 
-        where_sql, where_params = build_where_clause(where)
+        sql = info.upsert_sql(info.names, where_sql)
+        cur = await self.con.execute(sql, values + where_params)
+        # optional: await self.con.commit()
+        return int(getattr(obj, "id")) if info.has_id else 1
 
-        sql = (
-            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
-            f"ON CONFLICT(id) DO UPDATE SET {set_clause}{where_sql}"
-        )
 
-        params = [data[k] for k in keys] + where_params
-        cur = await self.con.execute(sql, params)
-        # optional: await self.con.commit()
-        return int(getattr(obj, "id")) if hasattr(obj, "id") else 1
+    async def join(
+        self,
+        *models: Union[type, LeftJoin],
+        where: Optional[WhereClause] = None,
+        order: list[OrderParam] = [],
+        limit: Optional[int] = None,
+    ) -> list[tuple]:
+        """
+        Join any number of models, each on a foreign key to one before it, e.g.
+        join(Trade, Stock, LeftJoin(Balance)). Tables are aliased by their own name, so
+        where/order use "trades.user_id" (or just "user_id" when it is unambiguous).
+        Returns one tuple of model instances per row, in argument order.
+        """
+        sides = []
+        for m in models:
+            outer = isinstance(m, LeftJoin)
+            model = m.model if outer else m
+            sides.append((model_info(model).table, model, outer))
+        return await self._join(join_plan(*sides), where, order, limit)
 
+    async def _join(self, plan: JoinPlan, where: Optional[WhereClause], order: list[OrderParam], limit: Optional[int]) -> list[tuple]:
+        where_sql, params = build_where_clause(where, plan.scope)
+        sql = plan.sql + where_sql
+
+        for idx, param in enumerate(order):
+            sql += " ORDER BY " if idx == 0 else ", "
+            sql += f"{plan.scope.resolve(param.field)} {'DESC' if param.descending else 'ASC'}"
+
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        cur = await self.con.execute(sql, params)
+        return [plan.decode(row) for row in await cur.fetchall()]
 
     async def join_select(
         self,
@@ -363,106 +997,135 @@ class Database:
         order: list[OrderParam] = [],
         limit: int | None = None,
     ) -> list[tuple[T, U]]:
-        if where is None:
-            where = []
+        """Inner join of two models aliased l and r (where=[WhereParam("r.user_id", ...)])."""
+        return await self._join(join_plan(("l", left, False), ("r", right, False)), where, order, limit)  # type: ignore[return-value]
 
-        la, ra = "l", "r"
-        lt, rt = python_to_table_name(left), python_to_table_name(right)
 
-        # infer join
-        side, fk_field, pk_field = _find_relationship(left, right)
-        if side == "left":
-            join_expr = f"{la}.{fk_field} = {ra}.{pk_field}"
-        else:
-            join_expr = f"{la}.{pk_field} = {ra}.{fk_field}"
-
-        # alias-qualified columns
-        select_cols = _alias_cols(left, la) + _alias_cols(right, ra)
-
-        sql = [
-            f"SELECT {', '.join(select_cols)}",
-            f"FROM {lt} {la}",
-            f"INNER JOIN {rt} {ra} ON {join_expr}",
-        ]
-
-        left_fields = {f.name for f in fields(left)}
-        right_fields = {f.name for f in fields(right)}
-
-        def qualify(name: str) -> str:
-            # unqualified name → search both tables
-            if "." in name:
-                return name  # allow explicit l.field or r.field
-            if name in left_fields:
-                return f"{la}.{name}"
-            if name in right_fields:
-                return f"{ra}.{name}"
-            raise ValueError(f"{name!r} is not a field of {left.__name__} or {right.__name__}")
-
-        params: list[Any] = []
 
-        where_sql, where_params = build_where_clause(where)
-        sql.append(where_sql)
-        params += where_params
-
-        if order:
-            sql.append("ORDER BY")
-            for i, p in enumerate(order):
-                if i:
-                    sql.append(", ")
-                sql.append(f"{qualify(p.field)} {'DESC' if p.descending else 'ASC'}")
-
-        if limit is not None:
-            sql.append("LIMIT ?")
-            params.append(limit)
+#-----------------------------------------------------------------
+#   Balances
 
-        query = " ".join(sql)
-        cur = await self.con.execute(query, params)
-        rows = await cur.fetchall()
+BALANCE_TRIGGER_PREFIX = "balance_"  # triggers managed by install_balance_triggers
 
-        out: list[tuple[T, U]] = []
-        for row in rows:
-            left_obj = _row_to(left, row, la)
-            right_obj = _row_to(right, row, ra)
-            out.append((left_obj, right_obj))
-        return out
+def ledger_sql(user: Optional[str] = None) -> str:
+    """
+    UNION ALL of (user_id, delta) rows over CREDIT_LEDGER.
+    `user` is an SQL expression ('?', 'NEW.id') restricting every branch to one user.
+    """
+    branches = []
+    for model, owner, amount, sign in CREDIT_LEDGER:
+        branch = f"SELECT {owner} AS user_id, {sign} * {amount} AS delta FROM {model_info(model).table}"
+        if user is not None:
+            branch += f" WHERE {owner} = {user}"
+        branches.append(branch)
+    return " UNION ALL ".join(branches)
+
+# (user_id, credit) for every user in the users table; other ids in the ledger have no credit
+LEDGER_CREDIT_SQL = (
+    f"SELECT ledger.user_id, TOTAL(ledger.delta) FROM ({ledger_sql()}) ledger "
+    f"WHERE ledger.user_id IN (SELECT id FROM {model_info(User).table}) "
+    f"GROUP BY ledger.user_id"
+)
 
+def balance_trigger_sql() -> list[str]:
+    balances = model_info(Balance).table
+    statements = []
+    for model, owner, amount, sign in CREDIT_LEDGER:
+        table = model_info(model).table
+        name = f"{BALANCE_TRIGGER_PREFIX}{table}_{owner}"
+        add = f"UPDATE {balances} SET credit = credit + {sign} * IFNULL(NEW.{amount}, 0) WHERE id = NEW.{owner};"
+        remove = f"UPDATE {balances} SET credit = credit - {sign} * IFNULL(OLD.{amount}, 0) WHERE id = OLD.{owner};"
+
+        if model is User:
+            # A new user starts with whatever the ledger already holds for them
+            add_row = f"INSERT OR REPLACE INTO {balances} (id, credit) SELECT NEW.id, TOTAL(delta) FROM ({ledger_sql('NEW.id')});"
+            remove_row = f"DELETE FROM {balances} WHERE id = OLD.id;"
+            statements.append(f"CREATE TRIGGER {name}_insert AFTER INSERT ON {table} BEGIN {add_row} END")
+            statements.append(f"CREATE TRIGGER {name}_delete AFTER DELETE ON {table} BEGIN {remove_row} END")
+            statements.append(f"CREATE TRIGGER {name}_update AFTER UPDATE OF {owner}, {amount} ON {table} BEGIN {remove_row} {add_row} END")
+        else:
+            statements.append(f"CREATE TRIGGER {name}_insert AFTER INSERT ON {table} BEGIN {add} END")
+            statements.append(f"CREATE TRIGGER {name}_delete AFTER DELETE ON {table} BEGIN {remove} END")
+            statements.append(f"CREATE TRIGGER {name}_update AFTER UPDATE OF {owner}, {amount} ON {table} BEGIN {remove} {add} END")
+    return statements
 
 
 DATABASE_NAME = "data/storage.db"
 
 
 #-----------------------------------------------------------------
-#   Initialisation
+#   Pooling
+
+async def open_pool(
+    path: str = DATABASE_NAME,
+    size: int = 4,
+    single_writer: bool = False,
+    pragmas: Optional[PragmaConfig] = None,
+    group_commit: Optional[GroupCommitConfig] = None,
+) -> DatabasePool:
+    """
+    Open (or top up) the shared pool for `path`. Every `Database(path)` created
+    afterwards borrows a warm connection instead of opening its own.
 
-async def init_database(timeout_data: list[User], stock_list: list[Stock]):
-    async with Database(DATABASE_NAME) as db:
-        await db.drop_table(User)
-        await db.create_table(User)
+    With `single_writer`, one connection serves every read/write unit in turn and
+    `size` read-only connections serve `Database(path, readonly=True)` units.
+    `group_commit` (single writer only) enables batching for `group_commit=True` units.
+    """
+    if group_commit and not single_writer:
+        raise ValueError("Group commit needs the single-writer topology")
+    if group_commit and pragmas and pragmas.synchronous is None:
+        # One fsync per batch is what group commit saves; NORMAL wouldn't sync at all
+        pragmas = replace(pragmas, synchronous="FULL")
+
+    pools = _POOLS.get(path)
+    if pools is None:
+        if single_writer:
+            writer = ConnectionPool(path, 1, pragmas)
+            pools = DatabasePool(
+                writer=writer,
+                readers=ConnectionPool(path, size, pragmas, readonly=True),
+                committer=GroupCommitter(writer, group_commit) if group_commit else None,
+            )
+        else:
+            pools = DatabasePool(writer=ConnectionPool(path, size, pragmas))
+        _POOLS[path] = pools
 
-        await db.drop_table(Log)
-        await db.create_table(Log)
-        
-        await db.create_table(Purchase)
+    # Writer first, so the file and its journal mode exist before any reader opens
+    await pools.writer.open()
+    if pools.readers:
+        await pools.readers.open()
+    return pools
 
-        await db.create_table(AdminBet)
-        await db.create_table(GambleWin)
+async def close_pool(path: str = DATABASE_NAME) -> None:
+    pools = _POOLS.pop(path, None)
+    if pools:
+        await pools.close()
 
-        await db.create_table(Gift)
+def get_pool_stats(path: str = DATABASE_NAME) -> dict[str, PoolStats]:
+    pools = _POOLS.get(path)
+    if pools is None:
+        return {}
 
-        if await db.create_table(Timestamps):
-            await db.insert(Timestamps(datetime.datetime.now(),datetime.datetime.now()))
+    stats = {"writer": pools.writer.stats()}
+    if pools.readers:
+        stats["readers"] = pools.readers.stats()
+    return stats
 
-        await db.create_table(DatabaseVersion)
+def get_group_commit_stats(path: str = DATABASE_NAME) -> Optional[GroupCommitStats]:
+    pools = _POOLS.get(path)
+    return pools.committer.stats() if pools and pools.committer else None
 
-        if await db.create_table(Stock):
-            for stock in stock_list:
-                await db.insert(stock)
 
-        await db.create_table(Trade)
-        
-        for timeout in timeout_data:
-            await db.insert_or_update(timeout, where=[WhereParam("id", timeout.id)])
+#-----------------------------------------------------------------
+#   Maintenance
 
+async def reconcile_balances() -> list[tuple[int, Optional[float], Optional[float]]]:
+    """Check the stored balances against the ledger, rebuilding them if they have drifted. Returns the drift."""
+    async with Database(DATABASE_NAME) as db:
+        drift = await db.balance_drift()
+        if drift:
+            await db.rebuild_balances()
+        return drift
 
 
 #-----------------------------------------------------------------
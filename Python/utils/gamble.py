@@ -1,21 +1,15 @@
 from .database import *
 
 
-async def record_gamble(gamble_user: int, bet_user: int, amount: float) -> int:
-    async with Database(DATABASE_NAME) as db:
-        gamble = AdminBet(None, amount, gamble_user, bet_user, False)
-        return await db.insert(gamble)
-    
 async def get_bets(user_id: int) -> dict[int, float]:
-    async with Database(DATABASE_NAME) as db:
-        bets = await db.select(AdminBet, where=[WhereParam("bet_user_id", user_id), WhereParam("used", False)])
-        groups: dict[int, float] = { x.gamble_user_id: 0 for x in bets}
-        for x in bets:
-            groups[x.gamble_user_id] += x.amount
-
-        return groups
+    async with Database(DATABASE_NAME, readonly=True) as db:
+        totals = await db.aggregate(AdminBet, sum=["amount"], group_by=["gamble_user_id"], where=[WhereParam("bet_user_id", user_id), WhereParam("used", False)])
+        return { t.group[0]: t.sums["amount"] for t in totals }
     
-def compute_betting_odds(bets: list[AdminBet]):
+def compute_betting_odds(bets: list[Aggregate]):
+    """
+    `bets` holds the summed amount per (bet_user_id, gamble_user_id) pair.
+    """
     # aggregation structure
     targets = defaultdict(lambda: {
         "total": 0.0,
@@ -24,9 +18,10 @@ def compute_betting_odds(bets: list[AdminBet]):
 
     # accumulate amounts
     for b in bets:
-        t = targets[b.bet_user_id]
-        t["total"] += b.amount
-        t["bettors"][b.gamble_user_id]["amount"] += b.amount
+        target_id, bettor_id = b.group
+        t = targets[target_id]
+        t["total"] += b.sums["amount"]
+        t["bettors"][bettor_id]["amount"] += b.sums["amount"]
 
     # compute total across all targets
     grand_total = sum(t["total"] for t in targets.values())
@@ -47,14 +42,14 @@ def compute_betting_odds(bets: list[AdminBet]):
 
 async def get_gamble_odds(consume_bets: bool):
     async with Database(DATABASE_NAME) as db:
-        all_bets = await db.select(AdminBet, where=[WhereParam("used", False)])
+        all_bets = await db.aggregate(AdminBet, sum=["amount"], group_by=["bet_user_id", "gamble_user_id"], where=[WhereParam("used", False)])
 
         if consume_bets:
             await db.update(AdminBet(None, None, None, None, True))
 
         return compute_betting_odds(bets=all_bets)
     
-async def payout_gamble(user: int, value: float):
+async def payout_gambles(payouts: dict[int, float]):
     async with Database(DATABASE_NAME) as db:
-        await db.insert(GambleWin(None, amount=value, user_id=user))
+        await db.insert_many([GambleWin(None, amount=value, user_id=user) for user, value in payouts.items()])
 
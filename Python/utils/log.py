@@ -4,14 +4,14 @@ import asyncio
     
 
 async def write_log(level: str, message: str) -> None:
-    async with Database(DATABASE_NAME) as db:
+    async with Database(DATABASE_NAME, group_commit=True) as db:
         log = Log(None, datetime.datetime.now(datetime.timezone.utc), level, message)
         await db.insert(log)
 
 async def read_logs(limit: int=100, level: Optional[str]=None):
-    async with Database(DATABASE_NAME) as db:
+    async with Database(DATABASE_NAME, readonly=True) as db:
         where = [WhereParam("level", level)] if level is not None else []
-        logs = await db.select(Log, where=where, order=[OrderParam("id", True)], limit=limit)
+        logs = [log async for log in db.stream(Log, where=where, order=[OrderParam("id", True)], limit=limit)]
         logs.reverse()
         return logs
     
@@ -0,0 +1,157 @@
+from .database import *
+from typing import Awaitable, Callable
+
+
+#-----------------------------------------------------------------
+#   Schema migrations
+#
+#   The database records the last migration applied in DatabaseVersion; on startup only the
+#   newer ones run, in order, and a database that is already current does no DDL at all.
+#   Append new migrations with the next version. Never edit one that has shipped.
+#
+#   `schema` runs in one write transaction together with the version bump.
+#   `backfill` is for rewriting big tables: it runs after the schema step, commits batch by
+#   batch so the bot keeps serving in between, and the version is only recorded once it has
+#   finished. It is re-run from the start if the bot stops half way, so it must be idempotent.
+
+@dataclass(frozen=True)
+class Migration:
+    version: Version
+    description: str
+    schema: Optional[Callable[[Database], Awaitable[None]]] = None
+    backfill: Optional[Callable[[], Awaitable[int]]] = None  # returns rows rewritten
+
+
+async def rewrite_in_batches(step: Callable[[Database, int], Awaitable[int]], batch_size: int = 500) -> int:
+    """
+    Call `step(db, batch_size)` in its own transaction until it handles fewer than
+    `batch_size` rows, yielding to the event loop between batches. Returns the total.
+    """
+    total = 0
+    while True:
+        async with Database(DATABASE_NAME) as db:
+            n = await step(db, batch_size)
+        total += n
+        if n < batch_size:
+            return total
+        await asyncio.sleep(0)
+
+
+# --- migrations ---
+
+# The tables and indexes as migration 1 shipped; later ones are added by the migrations that need them
+BASELINE_INDEXES: dict[type, list[tuple[str, ...]]] = {
+    User: [],
+    Log: [("level",)],
+    Purchase: [("user_id",), ("item_id", "timestamp")],
+    AdminBet: [("gamble_user_id",), ("bet_user_id",), ("used",)],
+    GambleWin: [("user_id",)],
+    Gift: [("giver",), ("receiver",)],
+    Timestamps: [],
+    DatabaseVersion: [],
+    Stock: [],
+    Trade: [("user_id",), ("stock", "sold_at")],
+    Balance: [],
+}
+
+async def initial_schema(db: Database):
+    """Everything init_database used to (re)create on every start."""
+    await db.drop_table_with_name("timeouts")  # replaced by users
+
+    for model in BASELINE_INDEXES:
+        created = await db.create_table(model, indexes=False)
+        if created and model is Timestamps:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            await db.insert(Timestamps(now, now))
+
+    created, dropped = await db.reconcile_indexes(BASELINE_INDEXES)
+    if created or dropped:
+        print(f"Reconciled indexes: created {created}, dropped {dropped}")
+
+    await db.install_balance_triggers()
+    await db.rebuild_balances()
+
+
+async def encode_epoch_datetimes() -> int:
+    """Rewrite values still stored as ISO text in epoch_datetime() columns. Reads accept both meanwhile."""
+    total = 0
+    for model in BASELINE_INDEXES:  # tables added later are written as epoch from the start
+        for col in model_info(model).columns:
+            if col.adapt is to_epoch_us:
+                total += await rewrite_in_batches(lambda db, n: db.encode_epoch_datetimes(model, col.name, n))
+    return total
+
+
+async def create_audit_log_checkpoint(db: Database):
+    # no row yet: the first ingestion does a full rebuild and records where it got to
+    await db.create_table(AuditLogCheckpoint)
+
+
+async def create_price_history(db: Database):
+    for model in (PriceTick, PriceCandle):
+        await db.create_table(model)
+
+
+async def bet_and_gift_indexes(db: Database):
+    created, dropped = await db.reconcile_indexes({
+        AdminBet: [("gamble_user_id",), ("used",), ("bet_user_id", "used")],
+        Gift: [("receiver",), ("giver", "receiver")],
+    })
+    print(f"Reconciled indexes: created {created}, dropped {dropped}")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(Version("1"), "initial schema", schema=initial_schema),
+    Migration(Version("2"), "datetimes as epoch microseconds", backfill=encode_epoch_datetimes),
+    Migration(Version("3"), "audit log checkpoint", schema=create_audit_log_checkpoint),
+    Migration(Version("4"), "price history", schema=create_price_history),
+    Migration(Version("5"), "bet and gift lookup indexes", schema=bet_and_gift_indexes),
+]
+
+
+#-----------------------------------------------------------------
+#   Runner
+
+async def get_database_version(db: Database) -> Version:
+    """The version recorded in the database; 0 for one that predates DatabaseVersion being used."""
+    if not await db.table_exists(model_info(DatabaseVersion).table):
+        return Version("0")
+    cur = await db.con.execute(f"SELECT version FROM {model_info(DatabaseVersion).table}")
+    row = await cur.fetchone()
+    return row[0] if row else Version("0")
+
+
+async def run_migrations() -> list[Migration]:
+    """Apply the migrations newer than the database's version, in order. Returns those applied."""
+    async with Database(DATABASE_NAME) as db:
+        current = await get_database_version(db)
+    pending = [m for m in MIGRATIONS if m.version > current]
+
+    for m in pending:
+        print(f"Migrating database to {m.version}: {m.description}")
+        async with Database(DATABASE_NAME) as db:
+            if not db.con.in_transaction:
+                await db.con.execute("BEGIN IMMEDIATE")  # DDL otherwise autocommits statement by statement
+            await db.create_table(DatabaseVersion)
+            if m.schema:
+                await m.schema(db)
+            if not m.backfill:
+                await db.insert_or_update(DatabaseVersion(m.version))
+
+        if m.backfill:
+            rows = await m.backfill()
+            print(f"Rewrote {rows} rows")
+            async with Database(DATABASE_NAME) as db:
+                await db.insert_or_update(DatabaseVersion(m.version))
+    return pending
+
+
+#-----------------------------------------------------------------
+#   Initialisation
+
+async def init_database(stock_list: list[Stock]):
+    await run_migrations()
+
+    async with Database(DATABASE_NAME) as db:
+        if not await db.select(Stock, limit=1):
+            await db.insert_many(stock_list)
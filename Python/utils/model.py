@@ -1,7 +1,7 @@
 import datetime
 import re
 from packaging.version import Version
-from dataclasses import dataclass, field, fields, asdict, Field
+from dataclasses import dataclass, field, fields, asdict, Field, MISSING
 from typing import Optional, Any, Type, TypeVar, Protocol, TypeVar, Type, Mapping, Protocol, ClassVar, Literal, get_origin, get_args
 
 
@@ -21,6 +21,24 @@ def single_value_table(cls):
     setattr(cls, "__single_value_table__", True)
     return cls
 
+def indexes(*columns: tuple[str, ...]):
+    """
+    Declare composite indexes on a model, e.g. @indexes(("stock", "sold_at")).
+    Single columns are better declared with indexed() / foreign_key().
+    """
+    def wrap(cls):
+        setattr(cls, "__indexes__", tuple(tuple(c) for c in columns))
+        return cls
+    return wrap
+
+def track_changes(cls):
+    """
+    Snapshot rows of this model as they are loaded, so Database.update only writes
+    the fields that changed since (and skips the object entirely if none did).
+    """
+    setattr(cls, "__track_changes__", True)
+    return cls
+
 # --- A dataclass type that has an int id ---
 class HasIdTable(Protocol):
     __dataclass_fields__: ClassVar[dict[str, Any]]
@@ -79,16 +97,46 @@ def assert_field_exists(model: Type[Any], name: str) -> None:
         valid = ", ".join(f.name for f in fields(model))
         raise ValueError(f"{name!r} not in {model.__name__} fields: {valid}")
 
-def foreign_key(model: Type[Any], column: str = "id", **extra):
+def foreign_key(model: Type[Any], column: str = "id", index: bool = True, **extra):
     assert_field_exists(model, column)
     return field(metadata={
         "fk": {
             "table": python_to_table_name(model),
             "column": column
         },
+        "index": index,
         **extra
     })
 
+def indexed(default: Any = MISSING, **extra):
+    if default is MISSING:
+        return field(metadata={"index": True, **extra})
+    return field(default=default, metadata={"index": True, **extra})
+
+# --- compact datetimes ---
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+def to_epoch_us(value: datetime.datetime) -> int:
+    """Microseconds since the unix epoch. Naive datetimes are taken as local time."""
+    if value.tzinfo is None:
+        value = value.astimezone()
+    return (value - EPOCH) // MICROSECOND
+
+def from_epoch_us(value: int) -> datetime.datetime:
+    """Aware UTC datetime from microseconds since the unix epoch."""
+    return EPOCH + datetime.timedelta(0, 0, value)  # integer arithmetic, so exact; positional args are the cheapest form
+
+def epoch_datetime(**extra):
+    """
+    Store this datetime column as an integer (microseconds since the epoch, UTC) instead
+    of ISO text: it keeps sub-second precision (the text adapter stops at seconds), compares
+    as a number and takes about half the space in the table and its indexes. Decoding is
+    slower than ISO text though (fromisoformat is implemented in C), see bench_datetime.
+    Values read back are aware UTC datetimes.
+    """
+    return field(metadata={"adapt": to_epoch_us, **extra})
+
 
 @dataclass
 class User:
@@ -99,26 +147,28 @@ class User:
 @dataclass
 class Log:
     id: int
-    timestamp: datetime.datetime
-    level: str
+    timestamp: datetime.datetime = epoch_datetime()
+    level: str = indexed()
     message: str
 
+@indexes(("item_id", "timestamp"))
 @dataclass
 class Purchase:
     id: int
-    timestamp: datetime.datetime
+    timestamp: datetime.datetime = epoch_datetime()
     item_id: int
     cost: int
     user_id: int = foreign_key(User)
     used: bool = False
 
+@indexes(("bet_user_id", "used"))
 @dataclass
 class AdminBet:
     id: int
     amount: float
     gamble_user_id: int = foreign_key(User)
-    bet_user_id: int = foreign_key(User)
-    used: bool = False
+    bet_user_id: int = foreign_key(User, index=False)  # covered by (bet_user_id, used)
+    used: bool = indexed(False)  # get_gamble_odds reads every unused bet
 
 @dataclass
 class GambleWin:
@@ -126,24 +176,31 @@ class GambleWin:
     amount: float
     user_id: int = foreign_key(User)
 
+@indexes(("giver", "receiver"))
 @dataclass
 class Gift:
     id: int
     amount: float
-    giver: int = foreign_key(User)
+    giver: int = foreign_key(User, index=False)  # covered by (giver, receiver)
     receiver: int = foreign_key(User)
 
 @single_value_table
 @dataclass
 class Timestamps:
-    last_roll: datetime.datetime
-    last_market_update: datetime.datetime
+    last_roll: datetime.datetime = epoch_datetime()
+    last_market_update: datetime.datetime = epoch_datetime()
 
 @single_value_table
 @dataclass
 class DatabaseVersion:
     version: Version
 
+@single_value_table
+@dataclass
+class AuditLogCheckpoint:
+    last_entry_id: int  # newest member_update audit-log entry folded into users
+
+@track_changes
 @dataclass
 class Stock:
     id: int
@@ -156,6 +213,8 @@ class Stock:
     volume_this_frame: float
     actor_target_price: float
 
+@track_changes
+@indexes(("stock", "sold_at"))
 @dataclass
 class Trade:
     id: int
@@ -163,7 +222,55 @@ class Trade:
     bought_at: float
     sold_at: Optional[float]
     user_id: int = foreign_key(User)
-    stock: int = foreign_key(Stock)
+    stock: int = foreign_key(Stock, index=False)  # covered by (stock, sold_at)
     short: bool = False
     auto_sell_low: Optional[float] = None
-    auto_sell_high: Optional[float] = None
\ No newline at end of file
+    auto_sell_high: Optional[float] = None
+
+# Raw market ticks, one row per stock per market clock tick. Times are epoch microseconds (see to_epoch_us)
+# kept as plain integers so history comes back as arrays without decoding every row.
+# Only the last few days are kept; PriceCandle holds the rest
+@indexes(("stock", "at"))
+@dataclass
+class PriceTick:
+    id: int
+    stock: int = foreign_key(Stock, index=False)  # covered by (stock, at)
+    at: int
+    value: float
+    volume: float   # shares traded either way since the previous tick
+
+# OHLC candles rolled up from the ticks as they are recorded. Only closed candles are stored;
+# the open one is rebuilt from the ticks on start up
+@indexes(("stock", "interval", "start"))
+@dataclass
+class PriceCandle:
+    id: int
+    stock: int = foreign_key(Stock, index=False)  # covered by (stock, interval, start)
+    interval: int   # seconds
+    start: int      # epoch microseconds
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+# Materialized shop credit, one row per user. Kept up to date by triggers on the CREDIT_LEDGER tables
+@dataclass
+class Balance:
+    id: int = foreign_key(User, index=False)  # the user's id, also the primary key
+    credit: float = 0.0
+
+# Every model backed by a table, in creation order
+TABLE_MODELS: list[type] = [User, Log, Purchase, AdminBet, GambleWin, Gift, Timestamps, DatabaseVersion, AuditLogCheckpoint, Stock, Trade, Balance, PriceTick, PriceCandle]
+
+# Every column that moves credit: (model, column holding the user id, amount column, sign).
+# User.duration is the credit earned from time spent timed out.
+# Trades don't count towards credit yet; their value depends on price as well as count
+CREDIT_LEDGER: list[tuple[type, str, str, int]] = [
+    (User, "id", "duration", +1),
+    (Purchase, "user_id", "cost", -1),
+    (AdminBet, "gamble_user_id", "amount", -1),
+    (GambleWin, "user_id", "amount", +1),
+    (Gift, "giver", "amount", -1),
+    (Gift, "receiver", "amount", +1),
+]
@@ -0,0 +1,379 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Optional, Sequence, Union
+from .registry import ModelInfo, model_info
+
+
+#-----------------------------------------------------------------
+#   Legacy where clauses
+
+@dataclass
+class WhereParam:
+    field: str
+    value: Any
+    cmp: str = '=' # '=', 'IS', 'IS NOT'
+
+WhereNode = Union[WhereParam, list[WhereParam]]
+WhereClause = list[WhereNode]
+
+
+#-----------------------------------------------------------------
+#   Predicates
+#
+#   F("level") == "ERROR", (F("low").is_not(None) | F("high").is_not(None)) & (F("stock") == 3)
+#   The SQL of a predicate only depends on its shape (fields, operators, which values are NULL),
+#   so it is rendered once per shape and scope; only the values are collected per call.
+
+OPERATORS = {"=", "!=", "<", "<=", ">", ">=", "IS", "IS NOT", "LIKE"}
+NULL_OPERATORS = {"=": "IS", "IS": "IS", "IS NOT": "IS NOT"}  # compared with None these become IS [NOT] NULL
+
+
+class Expr:
+    """
+    Predicate node. collect() appends a flat description of the node's shape and its
+    bound values in one pass; render() produces the SQL for that shape.
+    """
+    __slots__ = ()
+
+    def __and__(self, other: "Expr") -> "Expr":
+        return And(self, other)
+
+    def __or__(self, other: "Expr") -> "Expr":
+        return Or(self, other)
+
+    def collect(self, shape: list, params: list[Any]) -> None:
+        raise NotImplementedError
+
+    def render(self, scope: "Scope") -> str:
+        raise NotImplementedError
+
+    def adapters(self, scope: "Scope", out: list) -> None:
+        """Append, per value collect() binds, the column's python -> sqlite adapter (or None)."""
+        raise NotImplementedError
+
+
+class Cmp(Expr):
+    __slots__ = ("field", "op", "value")
+
+    def __init__(self, field: str, op: str, value: Any):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def collect(self, shape: list, params: list[Any]) -> None:
+        if self.value is None and self.op in NULL_OPERATORS:
+            shape += (self.field, self.op, True)
+        else:
+            shape += (self.field, self.op, False)
+            params.append(self.value)
+
+    def render(self, scope: "Scope") -> str:
+        if self.op not in OPERATORS:
+            raise ValueError(f"Unsupported operator {self.op!r}")
+        column = scope.resolve(self.field)
+        if self.value is None and self.op in NULL_OPERATORS:
+            return f"{column} {NULL_OPERATORS[self.op]} NULL"
+        return f"{column} {self.op} ?"
+
+    def adapters(self, scope: "Scope", out: list) -> None:
+        if not (self.value is None and self.op in NULL_OPERATORS):
+            out.append(scope.adapter(self.field))
+
+
+class In(Expr):
+    __slots__ = ("field", "values")
+
+    def __init__(self, field: str, values: Sequence[Any]):
+        self.field = field
+        self.values = tuple(values)
+
+    def collect(self, shape: list, params: list[Any]) -> None:
+        shape += ("IN", self.field, len(self.values))
+        params.extend(self.values)
+
+    def render(self, scope: "Scope") -> str:
+        if not self.values:
+            return "0"
+        return f"{scope.resolve(self.field)} IN ({', '.join('?' for _ in self.values)})"
+
+    def adapters(self, scope: "Scope", out: list) -> None:
+        out += [scope.adapter(self.field)] * len(self.values)
+
+
+class And(Expr):
+    __slots__ = ("parts",)
+    joiner = " AND "
+
+    def __init__(self, *parts: Expr):
+        # a & b & c is one group of three rather than nested pairs
+        flat: list[Expr] = []
+        for p in parts:
+            flat.extend(p.parts if type(p) is type(self) else (p,))
+        self.parts = tuple(flat)
+
+    def collect(self, shape: list, params: list[Any]) -> None:
+        shape.append(self.joiner)
+        for p in self.parts:
+            p.collect(shape, params)
+        shape.append(len(self.parts))
+
+    def render(self, scope: "Scope") -> str:
+        return "(" + self.joiner.join(p.render(scope) for p in self.parts) + ")"
+
+    def adapters(self, scope: "Scope", out: list) -> None:
+        for p in self.parts:
+            p.adapters(scope, out)
+
+
+class Or(And):
+    __slots__ = ()
+    joiner = " OR "
+
+
+class F:
+    """A field reference for building predicates: F("sold_at").is_(None) & (F("stock") == 3)."""
+    __hash__ = None  # type: ignore[assignment]
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, value: Any) -> Cmp:  # type: ignore[override]
+        return Cmp(self.name, "=", value)
+
+    def __ne__(self, value: Any) -> Cmp:  # type: ignore[override]
+        return Cmp(self.name, "!=", value)
+
+    def __lt__(self, value: Any) -> Cmp:
+        return Cmp(self.name, "<", value)
+
+    def __le__(self, value: Any) -> Cmp:
+        return Cmp(self.name, "<=", value)
+
+    def __gt__(self, value: Any) -> Cmp:
+        return Cmp(self.name, ">", value)
+
+    def __ge__(self, value: Any) -> Cmp:
+        return Cmp(self.name, ">=", value)
+
+    def is_(self, value: Any) -> Cmp:
+        return Cmp(self.name, "IS", value)
+
+    def is_not(self, value: Any) -> Cmp:
+        return Cmp(self.name, "IS NOT", value)
+
+    def like(self, pattern: str) -> Cmp:
+        return Cmp(self.name, "LIKE", pattern)
+
+    def in_(self, values: Sequence[Any]) -> In:
+        return In(self.name, tuple(values))
+
+
+#-----------------------------------------------------------------
+#   Scopes: which fields a predicate may name, and how they are qualified
+
+@dataclass(frozen=True, eq=False)
+class Scope:
+    """
+    One model (alias None, names used as-is) or the aliased models of a join,
+    where unqualified names resolve to the first model that has the field.
+    """
+    models: tuple[tuple[Optional[str], ModelInfo], ...]
+
+    def column(self, name: str) -> tuple[str, ModelInfo, str]:
+        """(qualified name, model, field) for a field name, validated."""
+        if "." in name:
+            prefix, field = name.split(".", 1)
+            for alias, info in self.models:
+                if alias == prefix:
+                    info.check_field(field)
+                    return name, info, field
+            if self.models[0][0] is None:
+                # e.g. excluded.x in an upsert
+                self.models[0][1].check_field(field)
+                return name, self.models[0][1], field
+            raise ValueError(f"Unknown table alias {prefix!r} in {name!r}")
+
+        for alias, info in self.models:
+            if name in info.name_set:
+                return (name if alias is None else f"{alias}.{name}"), info, name
+        if len(self.models) == 1:
+            self.models[0][1].check_field(name)
+        models = " or ".join(info.model.__name__ for _, info in self.models)
+        raise ValueError(f"{name!r} is not a field of {models}")
+
+    def resolve(self, name: str) -> str:
+        return self.column(name)[0]
+
+    def adapter(self, name: str) -> Optional[Callable[[Any], Any]]:
+        _, info, field = self.column(name)
+        return info.by_name[field].adapt
+
+
+@lru_cache(maxsize=None)
+def model_scope(model: type) -> Scope:
+    return Scope(((None, model_info(model)),))
+
+@lru_cache(maxsize=None)
+def join_scope(*aliased: tuple[str, type]) -> Scope:
+    return Scope(tuple((alias, model_info(model)) for alias, model in aliased))
+
+
+class _Unscoped:
+    """Names pass through unchecked, for callers without a model."""
+    def resolve(self, name: str) -> str:
+        return name
+
+    def adapter(self, name: str) -> None:
+        return None
+
+UNSCOPED = _Unscoped()
+
+
+#-----------------------------------------------------------------
+#   Prepared predicates
+#
+#   AUTOSELL = prepare(Trade, (F("stock") == Param("stock")) & F("sold_at").is_(None))
+#   await db.select(Trade, AUTOSELL.bind(stock=3))
+#   Rendered and validated once, typically at import; bind() only builds the parameter list.
+#   A Param always binds as a value, so `== Param(...)` never turns into IS NULL.
+
+class Param:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Bound:
+    __slots__ = ("scope", "sql", "params")
+
+    def __init__(self, scope: "Scope", sql: str, params: list[Any]):
+        self.scope = scope
+        self.sql = sql
+        self.params = params
+
+
+class Prepared:
+    def __init__(self, scope: "Scope", expr: Expr):
+        shape: list = []
+        slots: list[Any] = []
+        expr.collect(shape, slots)
+        sql = expr.render(scope)
+        self.scope = scope
+        self.sql = " WHERE " + (sql[1:-1] if type(expr) is And else sql)
+        adapters: list = []
+        expr.adapters(scope, adapters)
+        slots = [adapt(v) if adapt and v is not None and type(v) is not Param else v for v, adapt in zip(slots, adapters)]
+        # The constant values in place, and (index, name, adapter) for each slot filled by bind()
+        self.template = [None if type(v) is Param else v for v in slots]
+        self.binds = tuple((i, v.name, adapt or None) for i, (v, adapt) in enumerate(zip(slots, adapters)) if type(v) is Param)
+        self.names = frozenset(name for _, name, _ in self.binds)
+
+    def bind(self, **values: Any) -> Bound:
+        params = self.template.copy()
+        try:
+            for i, name, adapt in self.binds:
+                value = values[name]
+                params[i] = value if adapt is None or value is None else adapt(value)
+        except KeyError as e:
+            raise ValueError(f"No value for {e.args[0]!r}, expected {sorted(self.names)}") from None
+        return Bound(self.scope, self.sql, params)
+
+
+def prepare(model: type, expr: Expr) -> Prepared:
+    return Prepared(model_scope(model), expr)
+
+def prepare_join(models: Sequence[type], expr: Expr) -> Prepared:
+    """prepare() for db.join(*models), whose tables are aliased by their own name."""
+    return Prepared(join_scope(*((model_info(m).table, m) for m in models)), expr)
+
+
+#-----------------------------------------------------------------
+#   Compilation
+
+_TEMPLATES: dict[tuple, tuple[str, tuple]] = {}  # shape -> (sql, (param index, adapter) pairs)
+_MAX_TEMPLATES = 4096  # In() shapes vary with the list length; don't grow without bound
+
+
+def _legacy_collect(where: WhereClause, shape: list, params: list[Any]) -> None:
+    """Flat shape and values of a WhereParam list; AND between top-level nodes, OR inside nested lists."""
+    for node in where:
+        if node.__class__ is WhereParam:
+            if node.value is None and node.cmp in NULL_OPERATORS:
+                shape += (node.field, node.cmp, True)
+            else:
+                shape += (node.field, node.cmp, False)
+                params.append(node.value)
+        elif node:  # empty group, skip
+            shape.append(" OR ")
+            for p in node:
+                if p.value is None and p.cmp in NULL_OPERATORS:
+                    shape += (p.field, p.cmp, True)
+                else:
+                    shape += (p.field, p.cmp, False)
+                    params.append(p.value)
+            shape.append(len(node))
+
+def _legacy_expr(where: WhereClause) -> Expr:
+    parts: list[Expr] = []
+    for node in where:
+        if isinstance(node, WhereParam):
+            parts.append(Cmp(node.field, node.cmp, node.value))
+        elif node:
+            parts.append(Or(*(Cmp(p.field, p.cmp, p.value) for p in node)))
+    return And(*parts)
+
+
+def compile_where(where: Union[WhereClause, Expr, None], scope: Union[Scope, _Unscoped] = UNSCOPED) -> tuple[str, list[Any]]:
+    """
+    " WHERE ..." and its parameters for a list of WhereParam, a predicate or a bound prepared predicate.
+    The SQL is rendered (and its field names validated against `scope`) once per shape;
+    values compared with columns that have an adapter (e.g. epoch_datetime()) are adapted too.
+    """
+    if not where:
+        return "", []
+    if where.__class__ is Bound:
+        if scope is not UNSCOPED and where.scope is not scope:
+            raise ValueError("Prepared predicate used with a different model")
+        return where.sql, list(where.params)
+
+    if where.__class__ is list and len(where) == 1 and where[0].__class__ is WhereParam:
+        # One comparison (mostly by id): its key is the shape _legacy_collect would build
+        node = where[0]
+        null = node.value is None and node.cmp in NULL_OPERATORS
+        template = _TEMPLATES.get((scope, True, node.field, node.cmp, null))
+        if template is not None:
+            sql, adapt = template
+            if null:
+                return sql, []
+            value = node.value
+            return sql, [adapt[0][1](value) if adapt and value is not None else value]
+
+    legacy = not isinstance(where, Expr)
+    shape: list = [scope, legacy]
+    params: list[Any] = []
+    if legacy:
+        _legacy_collect(where, shape, params)
+    else:
+        where.collect(shape, params)
+    if len(shape) == 2:
+        return "", []
+
+    key = tuple(shape)
+    template = _TEMPLATES.get(key)
+    if template is None:
+        expr = _legacy_expr(where) if legacy else where
+        sql = expr.render(scope)
+        if type(expr) is And:
+            sql = sql[1:-1]  # top-level AND needs no parentheses
+        adapters: list = []
+        expr.adapters(scope, adapters)
+        if len(_TEMPLATES) >= _MAX_TEMPLATES:
+            _TEMPLATES.clear()
+        template = _TEMPLATES[key] = (" WHERE " + sql, tuple((i, a) for i, a in enumerate(adapters) if a))
+
+    sql, adapt = template
+    for i, a in adapt:
+        if params[i] is not None:
+            params[i] = a(params[i])
+    return sql, params
@@ -0,0 +1,174 @@
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Any, Callable, Optional, Sequence, Type, get_type_hints
+from .model import T, python_to_table_name, python_to_sql_type, is_nullable
+
+
+#-----------------------------------------------------------------
+#   Per-model metadata, compiled once per dataclass
+
+@dataclass(frozen=True)
+class ColumnInfo:
+    name: str
+    hint: Any
+    sql_type: str
+    nullable: bool
+    fk: Optional[tuple[str, str]]               # (table, column)
+    adapt: Optional[Callable[[Any], Any]] = None  # python -> sqlite, applied before binding
+
+
+@dataclass(frozen=True)
+class IndexInfo:
+    name: str
+    table: str
+    columns: tuple[str, ...]
+
+    @property
+    def create_sql(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+
+SNAPSHOT_ATTR = "__snapshot__"  # column values of a tracked object as last loaded/written
+
+INDEX_PREFIX = "ix_"  # indexes managed from model declarations; anything else is left alone
+
+def index_info(table: str, columns: Sequence[str]) -> IndexInfo:
+    return IndexInfo(f"{INDEX_PREFIX}{table}_{'_'.join(columns)}", table, tuple(columns))
+
+
+class ModelInfo:
+    """
+    Everything the ORM needs to know about a model, worked out once:
+    table name, columns, FK map and the SQL text for each statement shape.
+    """
+    def __init__(self, model: type):
+        self.model = model
+        self.table = python_to_table_name(model)
+        self.is_single = getattr(model, "__single_value_table__", False) is True
+        self.tracked = getattr(model, "__track_changes__", False) is True
+
+        hints = get_type_hints(model)
+        self.columns: tuple[ColumnInfo, ...] = tuple(
+            ColumnInfo(
+                name=f.name,
+                hint=hints[f.name],
+                sql_type=python_to_sql_type(hints[f.name]),
+                nullable=is_nullable(hints[f.name]),
+                fk=(f.metadata["fk"]["table"], f.metadata["fk"].get("column", "id")) if "fk" in f.metadata else None,
+                adapt=f.metadata.get("adapt"),
+            )
+            for f in fields(model)
+        )
+        self.names: tuple[str, ...] = tuple(c.name for c in self.columns)
+        self.name_set: frozenset[str] = frozenset(self.names)
+        self.by_name: dict[str, ColumnInfo] = {c.name: c for c in self.columns}
+        self.fks: dict[str, tuple[str, str]] = {c.name: c.fk for c in self.columns if c.fk}
+        self.has_id = "id" in self.name_set
+
+        declared = [(c.name,) for c, f in zip(self.columns, fields(model)) if f.metadata.get("index")]
+        declared += list(getattr(model, "__indexes__", ()))
+        for cols in declared:
+            for name in cols:
+                self.check_field(name)
+        self.indexes: tuple[IndexInfo, ...] = tuple(
+            index_info(self.table, cols) for cols in declared
+        )
+
+        self._adapters = tuple((i, c.adapt) for i, c in enumerate(self.columns) if c.adapt)
+        self.select_sql = f"SELECT {', '.join(self.names)} FROM {self.table}"
+        self.returning_sql = f" RETURNING {', '.join(self.names)}"
+
+    # --- values ---
+
+    def values(self, obj: Any) -> list[Any]:
+        """Column values of `obj` in declaration order, adapted for binding."""
+        values = [getattr(obj, name) for name in self.names]
+        for i, adapt in self._adapters:
+            if values[i] is not None:
+                values[i] = adapt(values[i])
+        return values
+
+    def adapt(self, name: str, value: Any) -> Any:
+        col = self.by_name.get(name)
+        if col is None or col.adapt is None or value is None:
+            return value
+        return col.adapt(value)
+
+    def from_row(self, row) -> Any:
+        """Build the model from a row selected with `select_sql` (same column order)."""
+        obj = self.model(*row)
+        if self.tracked:
+            obj.__dict__[SNAPSHOT_ATTR] = tuple(row)
+        return obj
+
+    # --- change tracking ---
+
+    def snapshot(self, obj: Any) -> None:
+        """Mark `obj` as matching its row, e.g. after it was written."""
+        if self.tracked:
+            obj.__dict__[SNAPSHOT_ATTR] = tuple(getattr(obj, name) for name in self.names)
+
+    def changed(self, obj: Any) -> Optional[tuple[str, ...]]:
+        """Fields of `obj` modified since it was loaded, or None if it isn't tracked."""
+        snapshot = obj.__dict__.get(SNAPSHOT_ATTR) if self.tracked else None
+        if snapshot is None:
+            return None
+        return tuple(name for name, old in zip(self.names, snapshot) if getattr(obj, name) != old)
+
+    def check_field(self, name: str) -> None:
+        if name not in self.name_set:
+            raise ValueError(f"{name!r} not in {self.model.__name__} fields: {', '.join(self.names)}")
+
+    # --- compiled statements, keyed by shape ---
+
+    @lru_cache(maxsize=None)
+    def projection_sql(self, columns: tuple[str, ...]) -> str:
+        for name in columns:
+            self.check_field(name)
+        return f"SELECT {', '.join(columns)} FROM {self.table}"
+
+    @lru_cache(maxsize=None)
+    def insert_sql(self, keys: tuple[str, ...]) -> str:
+        return f"INSERT INTO {self.table} ({', '.join(keys)}) VALUES ({', '.join('?' for _ in keys)})"
+
+    @lru_cache(maxsize=None)
+    def insert_missing_sql(self, keys: tuple[str, ...]) -> str:
+        return f"INSERT OR IGNORE INTO {self.table} ({', '.join(keys)}) VALUES ({', '.join('?' for _ in keys)})"
+
+    @lru_cache(maxsize=None)
+    def upsert_sql(self, keys: tuple[str, ...], where_sql: str = "") -> str:
+        if self.is_single:
+            conflict, updated = "guard", keys
+        else:
+            conflict, updated = "id", tuple(k for k in keys if k != "id")
+        set_clause = ", ".join(f"{k}=excluded.{k}" for k in updated)
+        return f"{self.insert_sql(keys)} ON CONFLICT({conflict}) DO UPDATE SET {set_clause}{where_sql}"
+
+    @lru_cache(maxsize=None)
+    def increment_sql(self, keys: tuple[str, ...]) -> str:
+        """Upsert by id adding `keys` onto the stored values; missing rows start from the deltas."""
+        for name in keys:
+            self.check_field(name)
+        set_clause = ", ".join(f"{k}=IFNULL({k}, 0) + excluded.{k}" for k in keys)
+        return f"{self.insert_sql(('id',) + keys)} ON CONFLICT(id) DO UPDATE SET {set_clause}{self.returning_sql}"
+
+    @lru_cache(maxsize=None)
+    def update_sql(self, keys: tuple[str, ...]) -> str:
+        return f"UPDATE {self.table} SET {', '.join(f'{k}=?' for k in keys)}"
+
+    @lru_cache(maxsize=None)
+    def aliased_columns(self, alias: str) -> tuple[str, ...]:
+        return tuple(f'{alias}.{name} AS "{alias}.{name}"' for name in self.names)
+
+    @lru_cache(maxsize=None)
+    def aliased_keys(self, alias: str) -> tuple[str, ...]:
+        return tuple(f"{alias}.{name}" for name in self.names)
+
+
+_REGISTRY: dict[type, ModelInfo] = {}
+
+def model_info(model: Type[T]) -> ModelInfo:
+    info = _REGISTRY.get(model)
+    if info is None:
+        info = _REGISTRY[model] = ModelInfo(model)
+    return info
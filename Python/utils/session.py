@@ -0,0 +1,104 @@
+from dataclasses import fields
+from .database import *
+
+
+#-----------------------------------------------------------------
+#   Session / unit of work
+
+class Session:
+    """
+    A Database unit with an identity map: rows loaded through the session are kept
+    per (model, id), so looking the same row up again is served from memory and
+    always hands back the same object.
+    Added objects, and changes to loaded @track_changes objects, are written
+    together by flush(), which runs on leaving the `async with` block.
+    """
+    def __init__(self, path: str = DATABASE_NAME, **unit_options):
+        self.db = Database(path, **unit_options)
+        self.identity: dict[tuple[type, Any], Any] = {}
+        self.new: list[Any] = []
+        self.dirty: dict[int, Any] = {}  # untracked objects marked with update(), by id()
+
+    async def __aenter__(self):
+        await self.db.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                await self.flush()
+            except BaseException as e:
+                await self.db.__aexit__(type(e), e, e.__traceback__)
+                raise
+        await self.db.__aexit__(exc_type, exc, tb)
+
+    # --- identity map ---
+
+    def _merge(self, obj: T, refresh: bool = False) -> T:
+        """The session's instance of `obj`'s row. With `refresh`, overwrite it with `obj`'s values."""
+        info = model_info(type(obj))
+        if not info.has_id:
+            return obj
+
+        key = (type(obj), obj.id)
+        cached = self.identity.get(key)
+        if cached is None:
+            self.identity[key] = obj
+            return obj
+        if refresh:
+            for f in fields(cached):
+                setattr(cached, f.name, getattr(obj, f.name))
+            info.snapshot(cached)
+        return cached
+
+    async def get(self, model: Type[T], id: int) -> Optional[T]:
+        cached = self.identity.get((model, id))
+        if cached is not None:
+            return cached
+        rows = await self.db.select(model, [WhereParam("id", id)])
+        return self._merge(rows[0]) if rows else None
+
+    async def refresh(self, model: Type[T], id: int) -> Optional[T]:
+        """Reload a row into the session's instance, dropping unflushed changes to it."""
+        rows = await self.db.select(model, [WhereParam("id", id)])
+        return self._merge(rows[0], refresh=True) if rows else None
+
+    async def select(self, model: Type[T], where: Optional[WhereClause] = None, order: list[OrderParam] = [], limit: Optional[int] = None) -> Union[T, list[T]]:
+        """Database.select, resolving every row through the identity map (pending changes win)."""
+        rows = await self.db.select(model, where, order, limit)
+        if model_info(model).is_single:
+            return rows
+        return [self._merge(row) for row in rows]
+
+    # --- pending changes ---
+
+    def add(self, obj: T) -> None:
+        """Insert `obj` on the next flush."""
+        self.new.append(obj)
+
+    def update(self, obj: T) -> None:
+        """Write `obj` on the next flush. Only needed for models without @track_changes."""
+        self.dirty[id(obj)] = obj
+
+    async def increment(self, model: Type[T], key: int, **deltas: float) -> T:
+        """Database.increment, after flushing so the deltas land on current values. Returns the session's instance."""
+        await self.flush()
+        return self._merge(await self.db.increment(model, key, **deltas), refresh=True)
+
+    async def flush(self) -> None:
+        new, self.new = self.new, []
+        by_model: dict[type, list[Any]] = defaultdict(list)
+        for obj in new:
+            by_model[type(obj)].append(obj)
+        for objs in by_model.values():
+            await self.db.insert_many(objs)
+            for obj in objs:
+                self._merge(obj)
+
+        dirty, self.dirty = self.dirty, {}
+        written = set()
+        for obj in list(dirty.values()) + [o for o in self.identity.values() if model_info(type(o)).tracked]:
+            if id(obj) in written:
+                continue
+            written.add(id(obj))
+            await self.db.update(obj)
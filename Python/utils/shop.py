@@ -404,51 +404,29 @@ class BlackFridaySaleItem(ShopItem):
 #-----------------------------------------------------------------
 #   Database Access
             
-async def get_shop_credit(user_id: int) -> float:
-    async with Database(DATABASE_NAME) as db:
-        user = await db.select(User, [WhereParam("id", user_id)])
-        if not user:
-            return 0
-        
-        user = user[0]
-
-        purchases = await db.select(Purchase, where=[WhereParam("user_id", user_id)])
-
-        winnings = await db.select(GambleWin, where=[WhereParam("user_id", user_id)])
-        bets = await db.select(AdminBet, where=[WhereParam("gamble_user_id", user_id)])
-
-        gifts_sent = await db.select(Gift, where=[WhereParam("giver", user.id)])
-        gifts_received  = await db.select(Gift, where=[WhereParam("receiver", user.id)])
-
-        # stock_unfulfilled = await db.select(Trade, where=[WhereParam("user_id", user.id), WhereParam("sold_at", None, "IS")])
-        # stock_fulfilled_long = await db.select(Trade, where=[WhereParam("user_id", user.id), WhereParam("sold_at", None, "IS NOT"), WhereParam("short", False)])
-        # stock_fulfilled_short = await db.select(Trade, where=[WhereParam("user_id", user.id), WhereParam("sold_at", None, "IS NOT"), WhereParam("short", True)])
+async def get_shop_credit(user_id: int, db: Optional[Database] = None) -> float:
+    """`user_id`'s credit, read on `db` if given so callers with a unit open don't take a second connection."""
+    if db is None:
+        async with Database(DATABASE_NAME, readonly=True) as db:
+            return await get_shop_credit(user_id, db)
 
-        credit = user.duration
+    balance = await db.select(Balance, [WhereParam("id", user_id)])
+    return balance[0].credit if balance else 0
 
-        credit -= sum([p.cost for p in purchases])
+async def get_all_shop_credit() -> dict[int, float]:
+    async with Database(DATABASE_NAME, readonly=True) as db:
+        return { user_id: credit async for user_id, credit in db.stream(Balance, columns=("id", "credit")) }
 
-        credit -= sum([b.amount for b in bets])
-        credit += sum([w.amount for w in winnings])
-
-        credit -= sum([g.amount for g in gifts_sent])
-        credit += sum([g.amount for g in gifts_received])
-
-        # credit -= sum([s.bought_at * s.count for s in stock_unfulfilled])
-        # credit += sum([(s.sold_at - s.bought_at) * s.count for s in stock_fulfilled_long])
-        # credit -= sum([(s.sold_at - s.bought_at) * s.count for s in stock_fulfilled_short])
-
-        return credit
-
-async def can_afford_purchase(user: int, cost: int) -> bool:
-    credit = await get_shop_credit(user)
-    return cost <= credit
+async def spend(user_id: int, amount: float, record: Any) -> bool:
+    """Atomically check `user_id` can afford `amount` and insert the ledger row `record` that spends it."""
+    async with Database(DATABASE_NAME) as db:
+        return await db.spend(user_id, amount, record)
 
 async def is_ongoing_sale() -> tuple[bool, Optional[datetime.datetime]]:
-    async with Database(DATABASE_NAME) as db:
+    async with Database(DATABASE_NAME, readonly=True) as db:
         sale = await db.select(Purchase, where=[WhereParam("item_id", BlackFridaySaleItem.ITEM_ID)], order=[OrderParam("timestamp", True)])
         if not sale:
             return False, None
         
         end_time = sale[0].timestamp + datetime.timedelta(minutes=30)
-        return datetime.datetime.now() < end_time, end_time
\ No newline at end of file
+        return datetime.datetime.now(datetime.timezone.utc) < end_time, end_time
\ No newline at end of file
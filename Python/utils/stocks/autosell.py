@@ -0,0 +1,95 @@
+import heapq
+from dataclasses import dataclass
+from typing import Optional
+from ..model import Trade
+
+
+#-----------------------------------------------------------------
+#   Autosell index
+#
+#   The open trades with an autosell threshold, kept in memory per stock so a market update
+#   only has to look at the trades it actually triggers. A trade sells when the sell price falls
+#   below its auto_sell_low or the buy price rises above its auto_sell_high, so each stock has
+#   a max-heap of lows and a min-heap of highs and crossed trades sit at the top.
+#   Heap entries are never removed in place: a closed or re-thresholded trade leaves a stale
+#   entry behind, which is skipped when it reaches the top (checked against `live`).
+
+@dataclass(frozen=True)
+class Autosell:
+    trade_id: int
+    user_id: int
+    stock: int
+    low: Optional[float]
+    high: Optional[float]
+
+
+class AutosellIndex:
+    def __init__(self):
+        self.live: dict[int, Autosell] = {}                     # trade id -> current thresholds
+        self.lows: dict[int, list[tuple[float, int]]] = {}      # stock -> heap of (-auto_sell_low, trade id)
+        self.highs: dict[int, list[tuple[float, int]]] = {}     # stock -> heap of (auto_sell_high, trade id)
+        self.loaded = False
+
+    def load(self, trades: list[Trade]) -> None:
+        """Replace the index with the open trades in `trades`."""
+        self.live.clear()
+        self.lows.clear()
+        self.highs.clear()
+        for trade in trades:
+            self.add(trade)
+        self.loaded = True
+
+    def add(self, trade: Trade) -> None:
+        """Index `trade`, or re-index it after its thresholds changed."""
+        self.discard(trade.id)
+        if trade.sold_at is not None or (trade.auto_sell_low is None and trade.auto_sell_high is None):
+            return
+
+        self.live[trade.id] = Autosell(trade.id, trade.user_id, trade.stock, trade.auto_sell_low, trade.auto_sell_high)
+        if trade.auto_sell_low is not None:
+            heapq.heappush(self.lows.setdefault(trade.stock, []), (-trade.auto_sell_low, trade.id))
+        if trade.auto_sell_high is not None:
+            heapq.heappush(self.highs.setdefault(trade.stock, []), (trade.auto_sell_high, trade.id))
+
+    def discard(self, trade_id: int) -> None:
+        """Forget `trade_id` (closed, or about to be re-added); its heap entries go stale."""
+        entry = self.live.pop(trade_id, None)
+        if entry is not None:
+            self._compact(entry.stock)
+
+    def crossed(self, stock: int, low: float, high: float) -> list[Autosell]:
+        """Pop the trades of `stock` whose thresholds the sell price `low` / buy price `high` cross."""
+        hits: list[Autosell] = []
+
+        heap = self.lows.get(stock, [])
+        while heap and -heap[0][0] > low:
+            threshold, trade_id = heapq.heappop(heap)
+            entry = self.live.get(trade_id)
+            if entry is not None and entry.low == -threshold:
+                hits.append(self.live.pop(trade_id))
+
+        heap = self.highs.get(stock, [])
+        while heap and heap[0][0] < high:
+            threshold, trade_id = heapq.heappop(heap)
+            entry = self.live.get(trade_id)
+            if entry is not None and entry.high == threshold:
+                hits.append(self.live.pop(trade_id))
+
+        if hits:
+            self._compact(stock)
+        return hits
+
+    def _compact(self, stock: int) -> None:
+        """Rebuild a stock's heaps once they have grown well past the live trades."""
+        size = len(self.lows.get(stock, ())) + len(self.highs.get(stock, ()))
+        if size <= 64 or size <= 4 * len(self.live):  # compared to every live trade so the check stays O(1)
+            return
+        live = [e for e in self.live.values() if e.stock == stock]
+        self.lows[stock] = [(-e.low, e.trade_id) for e in live if e.low is not None]
+        self.highs[stock] = [(e.high, e.trade_id) for e in live if e.high is not None]
+        heapq.heapify(self.lows[stock])
+        heapq.heapify(self.highs[stock])
+
+
+# Module level so it survives cog hot reloads
+AUTOSELL_INDEX = AutosellIndex()
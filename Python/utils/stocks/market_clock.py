@@ -0,0 +1,160 @@
+import asyncio
+import dataclasses
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from utils.stocks.stock_controls import order_stock
+import utils.stocks.stock_engine as stock_engine
+from utils.stocks.price_history import PriceHistory
+from ..database import *
+
+_log = logging.getLogger(__name__)
+
+
+#-----------------------------------------------------------------
+#   Market clock
+#
+#   Runs the market in the background on a fixed cadence instead of catching up lazily on
+#   every command. While it runs it owns the stocks rows: the state lives in a MarketState,
+#   orders are applied to it in memory, and it is written back every few ticks in one
+#   transaction. Readers get an immutable MarketSnapshot published after every change.
+#   Every tick is also recorded into the price history, which is written along with the market.
+#   Started from stock_market_cog (stock_db.start_market_clock), so dormant while that cog is disabled.
+
+FRAME_SECONDS = 5.0  # one simulation frame, as update_market_since_last_action
+
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    at: datetime.datetime
+    by_id: dict[int, Stock]     # copies; never mutated once published
+    by_code: dict[str, Stock]
+    lows: dict[int, float]      # sell price per stock id
+    highs: dict[int, float]     # buy price per stock id
+
+
+TickHook = Callable[[MarketSnapshot, stock_engine.PricePath], Awaitable[None]]
+
+
+class MarketClock:
+    def __init__(self, tick_seconds: float = FRAME_SECONDS, persist_every: int = 12):
+        self.tick_seconds = tick_seconds
+        self.persist_every = persist_every  # ticks between writes to the database
+        self.stocks: list[Stock] = []
+        self.index: dict[int, int] = {}     # stock id -> position in the arrays
+        self.state: Optional[stock_engine.MarketState] = None
+        self.snapshot: Optional[MarketSnapshot] = None
+        self.history = PriceHistory()
+        self.last_update = datetime.datetime.now(datetime.timezone.utc)
+        self.on_tick: Optional[TickHook] = None
+        self.task: Optional[asyncio.Task] = None
+        self.ticks = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self, on_tick: Optional[TickHook] = None) -> None:
+        """Load the market (already caught up to now by the caller) and start ticking."""
+        if self.running:
+            return
+        async with Database(DATABASE_NAME) as db:
+            self.stocks = await db.select(Stock, order=[OrderParam("id", False)])
+            self.last_update = (await db.select(Timestamps)).last_market_update
+            await self.history.load(db, [s.id for s in self.stocks])
+        self.index = {s.id: i for i, s in enumerate(self.stocks)}
+        self.state = stock_engine.MarketState.from_stocks(self.stocks)
+        self.on_tick = on_tick
+        self.publish()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.state is not None:
+            await self.persist()
+
+    async def run(self) -> None:
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick_seconds
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            try:
+                await self.tick()
+            except Exception:
+                _log.exception("Market tick failed")
+
+    async def tick(self, now: Optional[datetime.datetime] = None) -> None:
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        elapsed = (now - self.last_update).total_seconds()
+        if elapsed <= 0:
+            return
+
+        stock_engine.update_directions(self.state, stock_engine.direction_changes(self.last_update, now))
+        path = stock_engine.PricePath()
+        stock_engine.advance(self.state, elapsed / FRAME_SECONDS, path=path)
+        self.last_update = now
+        self.history.record(now, list(self.index), self.state.value.tolist(), self.state.traded.tolist())
+        self.state.traded[:] = 0
+        self.publish()
+
+        if self.on_tick is not None:
+            await self.on_tick(self.snapshot, path)
+
+        self.ticks += 1
+        if self.ticks % self.persist_every == 0:
+            await self.persist()
+
+    def apply_order(self, stock_id: int, count: float) -> Optional[Stock]:
+        """order_stock on the live market. Returns the stock as it now stands, or None if unknown."""
+        i = self.index.get(stock_id)
+        if i is None:
+            return None
+        stock = self.stock_at(i)
+        order_stock(stock, count)
+        self.state.value[i] = stock.value
+        self.state.volume_this_frame[i] = stock.volume_this_frame
+        self.state.traded[i] += abs(count)
+        self.publish()
+        return stock
+
+    def stock_at(self, i: int) -> Stock:
+        s = self.state
+        return dataclasses.replace(
+            self.stocks[i],
+            value=float(s.value[i]), drift=float(s.drift[i]), volatility=float(s.volatility[i]),
+            volume=float(s.volume[i]), volume_this_frame=float(s.volume_this_frame[i]),
+            actor_target_price=float(s.actor_target_price[i]),
+        )
+
+    def publish(self) -> None:
+        stocks = [self.stock_at(i) for i in range(len(self.stocks))]
+        lows, highs = stock_engine.buy_sell_prices(self.state)
+        self.snapshot = MarketSnapshot(
+            at=self.last_update,
+            by_id={s.id: s for s in stocks},
+            by_code={s.code: s for s in stocks},
+            lows=dict(zip(self.index, lows.tolist())),
+            highs=dict(zip(self.index, highs.tolist())),
+        )
+
+    async def persist(self) -> None:
+        """Write the market and its clock in one transaction; only columns that moved are written."""
+        self.state.write_back(self.stocks)
+        async with Database(DATABASE_NAME) as db:
+            for stock in self.stocks:
+                await db.update(stock)
+            timestamps = await db.select(Timestamps)
+            timestamps.last_market_update = self.last_update
+            await db.update(timestamps)
+            await self.history.flush(db, self.last_update)
+
+
+# Module level so it survives cog hot reloads
+MARKET_CLOCK = MarketClock()
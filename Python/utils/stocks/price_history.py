@@ -0,0 +1,185 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Sequence
+from ..database import *
+
+
+#-----------------------------------------------------------------
+#   Price history
+#
+#   The market clock records every stock's price each tick. Ticks are buffered here and
+#   written with the market, in one insert per batch. Candles are rolled up as the ticks
+#   come in: each (stock, interval) has one open candle in memory, and it is queued for
+#   writing when a tick lands in the next bucket. Raw ticks and 1m candles expire after a
+#   while, so storage stays bounded while the coarser candles keep the long history.
+
+CANDLE_INTERVALS = {"1m": 60, "15m": 15 * 60, "1h": 60 * 60, "1d": 24 * 60 * 60}
+
+TICK_RETENTION = datetime.timedelta(days=2)  # at least the longest interval, so open candles can be rebuilt
+CANDLE_RETENTION: dict[int, Optional[datetime.timedelta]] = {
+    60: datetime.timedelta(days=30),
+    15 * 60: datetime.timedelta(days=365),
+    60 * 60: None,
+    24 * 60 * 60: None,
+}
+EXPIRE_EVERY = 60 * 60 * 1_000_000  # us between expiry runs
+
+US = 1_000_000  # microseconds per second
+
+TICK_RANGE = prepare(PriceTick, (F("stock") == Param("stock")) & (F("at") >= Param("start")) & (F("at") < Param("end")))
+CANDLE_RANGE = prepare(PriceCandle, (F("stock") == Param("stock")) & (F("interval") == Param("interval")) & (F("start") >= Param("start")) & (F("start") < Param("end")))
+
+
+@dataclass
+class TickSeries:
+    at: np.ndarray      # datetime64[us], UTC
+    value: np.ndarray
+    volume: np.ndarray
+
+
+@dataclass
+class CandleSeries:
+    start: np.ndarray   # datetime64[us], UTC
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+
+def bucket_start(at: int, interval: int) -> int:
+    return at - at % (interval * US)
+
+
+class PriceHistory:
+    def __init__(self):
+        self.open: dict[tuple[int, int], PriceCandle] = {}  # (stock, interval) -> candle being built
+        self.pending_ticks: list[PriceTick] = []
+        self.pending_candles: list[PriceCandle] = []
+        self.last_expired = 0
+
+    def record(self, at: datetime.datetime, stock_ids: Sequence[int], values: Sequence[float], volumes: Sequence[float]) -> None:
+        """One tick for every stock, all taken at `at`."""
+        at_us = to_epoch_us(at)
+        for stock, value, volume in zip(stock_ids, values, volumes):
+            self.pending_ticks.append(PriceTick(None, stock, at_us, value, volume))
+            for interval in CANDLE_INTERVALS.values():
+                self.fold(stock, interval, at_us, value, value, value, value, volume)
+
+    def fold(self, stock: int, interval: int, at: int, open: float, high: float, low: float, close: float, volume: float) -> None:
+        start = bucket_start(at, interval)
+        candle = self.open.get((stock, interval))
+        if candle is not None and candle.start != start:
+            self.pending_candles.append(candle)
+            candle = None
+
+        if candle is None:
+            self.open[(stock, interval)] = PriceCandle(None, stock, interval, start, open, high, low, close, volume)
+        else:
+            candle.high = max(candle.high, high)
+            candle.low = min(candle.low, low)
+            candle.close = close
+            candle.volume += volume
+
+    async def load(self, db: Database, stock_ids: Sequence[int]) -> None:
+        """Rebuild the open candles from the stored ticks of their buckets."""
+        self.open.clear()
+        longest = max(CANDLE_INTERVALS.values())
+        for stock in stock_ids:
+            last = await db.select(PriceTick, where=[WhereParam("stock", stock)], order=[OrderParam("at", True)], limit=1)
+            if not last:
+                continue
+            ticks = await self._ticks(db, stock, bucket_start(last[0].at, longest), last[0].at + 1)
+            for interval in CANDLE_INTERVALS.values():
+                mask = ticks.at >= bucket_start(last[0].at, interval)
+                value, volume = ticks.value[mask], ticks.volume[mask]
+                start = bucket_start(last[0].at, interval)
+                self.open[(stock, interval)] = PriceCandle(
+                    None, stock, interval, start,
+                    float(value[0]), float(value.max()), float(value.min()), float(value[-1]), float(volume.sum()),
+                )
+
+    async def flush(self, db: Database, now: datetime.datetime) -> None:
+        """Write what has been recorded since the last flush, and expire old rows once in a while."""
+        await db.insert_many(self.pending_ticks)
+        await db.insert_many(self.pending_candles)
+        self.pending_ticks = []
+        self.pending_candles = []
+
+        now_us = to_epoch_us(now)
+        if now_us - self.last_expired >= EXPIRE_EVERY:
+            self.last_expired = now_us
+            await self.expire(db, now_us)
+
+    async def expire(self, db: Database, now: int) -> None:
+        stock_ids = {stock for stock, _ in self.open}
+        tick_cutoff = now - TICK_RETENTION // MICROSECOND
+        for stock in stock_ids:  # one range per stock so the (stock, ...) indexes are used
+            await db.delete(PriceTick, where=[WhereParam("stock", stock), WhereParam("at", tick_cutoff, "<")])
+            for interval, keep in CANDLE_RETENTION.items():
+                if keep is not None:
+                    cutoff = now - keep // MICROSECOND
+                    await db.delete(PriceCandle, where=[WhereParam("stock", stock), WhereParam("interval", interval), WhereParam("start", cutoff, "<")])
+
+    # --- range queries ---
+
+    async def ticks(self, stock: int, start: datetime.datetime, end: datetime.datetime) -> TickSeries:
+        """Raw ticks of `stock` in [start, end), oldest first, including ones not written yet."""
+        start_us, end_us = to_epoch_us(start), to_epoch_us(end)
+        async with Database(DATABASE_NAME, readonly=True) as db:
+            stored = await self._ticks(db, stock, start_us, end_us)
+
+        pending = [t for t in self.pending_ticks if t.stock == stock and start_us <= t.at < end_us]
+        if not pending:
+            return _as_datetimes(stored)
+        return _as_datetimes(TickSeries(
+            at=np.concatenate([stored.at, [t.at for t in pending]]).astype(np.int64),
+            value=np.concatenate([stored.value, [t.value for t in pending]]),
+            volume=np.concatenate([stored.volume, [t.volume for t in pending]]),
+        ))
+
+    async def candles(self, stock: int, interval: str, start: datetime.datetime, end: datetime.datetime) -> CandleSeries:
+        """
+        Candles of `stock` at `interval` ("1m", "15m", "1h" or "1d") starting in [start, end), oldest
+        first. The last one may still be open.
+        """
+        seconds = CANDLE_INTERVALS[interval]
+        start_us, end_us = to_epoch_us(start), to_epoch_us(end)
+        async with Database(DATABASE_NAME, readonly=True) as db:
+            rows = [row async for row in db.stream(
+                PriceCandle,
+                where=CANDLE_RANGE.bind(stock=stock, interval=seconds, start=start_us, end=end_us),
+                order=[OrderParam("start", False)],
+                columns=("start", "open", "high", "low", "close", "volume"),
+                chunk_size=4096,
+            )]
+
+        # not written yet, then the open one
+        in_memory = [c for c in self.pending_candles if c.stock == stock and c.interval == seconds]
+        if (stock, seconds) in self.open:
+            in_memory.append(self.open[(stock, seconds)])
+        stored_to = rows[-1][0] if rows else -1
+        rows += [(c.start, c.open, c.high, c.low, c.close, c.volume) for c in in_memory if start_us <= c.start < end_us and c.start > stored_to]
+
+        data = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        return CandleSeries(
+            start=np.array([row[0] for row in rows], dtype=np.int64).astype("datetime64[us]"),
+            open=data[:, 1], high=data[:, 2], low=data[:, 3], close=data[:, 4], volume=data[:, 5],
+        )
+
+    async def _ticks(self, db: Database, stock: int, start: int, end: int) -> TickSeries:
+        """Stored ticks in [start, end) with `at` left as epoch microseconds."""
+        rows = [row async for row in db.stream(
+            PriceTick,
+            where=TICK_RANGE.bind(stock=stock, start=start, end=end),
+            order=[OrderParam("at", False)],
+            columns=("at", "value", "volume"),
+            chunk_size=4096,
+        )]
+        at = np.array([row[0] for row in rows], dtype=np.int64)
+        data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+        return TickSeries(at=at, value=data[:, 1], volume=data[:, 2])
+
+
+def _as_datetimes(series: TickSeries) -> TickSeries:
+    return TickSeries(at=series.at.astype("datetime64[us]"), value=series.value, volume=series.volume)
@@ -2,6 +2,12 @@ from utils.shop import get_shop_credit
 from utils.stocks.stock_controls import *
 from ..model import Stock
 from ..database import *
+from ..session import Session
+import utils.stocks.stock_engine as stock_engine
+from utils.stocks.market_clock import MARKET_CLOCK, MarketSnapshot
+from utils.stocks.price_history import CandleSeries, TickSeries
+from utils.stocks.autosell import AUTOSELL_INDEX, Autosell
+import numpy as np
 from typing import Callable, Awaitable
 
 
@@ -9,155 +15,274 @@ from typing import Callable, Awaitable
 #   Stock Market
 
 async def get_all_stocks() -> list[Stock]:
-    async with Database(DATABASE_NAME) as db:
+    if MARKET_CLOCK.running:
+        return list(MARKET_CLOCK.snapshot.by_id.values())
+    async with Database(DATABASE_NAME, readonly=True) as db:
         return await db.select(Stock)
     
+# A user's open trades with their stocks
+UNSOLD_ORDERS = prepare_join((Stock, Trade), (F("trades.user_id") == Param("user_id")) & F("trades.sold_at").is_(None))
+
 async def get_unsold_orders(user_id: int) -> list[tuple[Stock, Trade]]:
-    async with Database(DATABASE_NAME) as db:
-        return await db.join_select(Stock, Trade, where=[WhereParam("r.user_id", user_id), WhereParam("r.sold_at", None, "IS")])
+    async with Database(DATABASE_NAME, readonly=True) as db:
+        rows = await db.join(Stock, Trade, where=UNSOLD_ORDERS.bind(user_id=user_id))
+    if MARKET_CLOCK.running:  # stored prices lag the live market
+        snapshot = MARKET_CLOCK.snapshot
+        rows = [(snapshot.by_id.get(stock.id, stock), trade) for stock, trade in rows]
+    return rows
     
-async def can_afford_stock(user_id: int, stock_id: str, count: int) -> tuple[bool, Optional[str]]:
-    credit = await get_shop_credit(user_id)
+async def get_stock(session: Session, stock_id: str) -> Optional[Stock]:
+    if MARKET_CLOCK.running:
+        return MARKET_CLOCK.snapshot.by_code.get(stock_id.upper())
+    stocks = await session.select(Stock, where=[WhereParam("code", stock_id.upper())])
+    return stocks[0] if stocks else None
 
-    async with Database(DATABASE_NAME) as db:
-        stocks = await db.select(Stock, where=[WhereParam("code", stock_id.upper())])
-        if not stocks:
-            return False, "Trying to buy a stock that doesn't exist!"
-        
-        stock = stocks[0]
+async def can_afford_stock(user_id: int, stock_id: str, count: int, session: Optional[Session] = None) -> tuple[bool, Optional[str]]:
+    if session is None:
+        async with Session(DATABASE_NAME, readonly=True) as session:
+            return await can_afford_stock(user_id, stock_id, count, session)
 
-        _, buy_price = calculate_buy_sell_price(stock)
-        
-        if (buy_price * count) < credit:
-            return True, None
-        else:
-            return False, "Can't afford this purchase!"
+    credit = await get_shop_credit(user_id, session.db)
 
-async def do_stock_market_update(db, dt: float, autosell_callback: Callable[[str], Awaitable]):
-    stocks = await db.select(Stock)
-    time_frames = dt / 5.0  # 15 minute intervals
-    dt = await update_stocks_rand(stocks,time_frames) * 5.0
-
-    for stock in stocks:
-        await db.update(stock)
-
-        low, high = calculate_buy_sell_price(stock)
-        autosell_trades = await db.select(Trade, where=[WhereParam("stock", stock.id), WhereParam("sold_at", None), [WhereParam("auto_sell_low", None, "IS NOT"), WhereParam("auto_sell_high", None, "IS NOT")]])
-        for trade in autosell_trades:
-            sell = (trade.auto_sell_low is not None and trade.auto_sell_low > low) or (trade.auto_sell_high is not None and trade.auto_sell_high < high)
-            if sell:
-                success, msg = await close_market_trade(db, trade.user_id, trade.id)
-                if (success):
-                    await autosell_callback(msg)
-    return dt
-
-async def do_stock_market_directions_update(db, iterations : int):
-    if(iterations>0):
-        stocks = await db.select(Stock)
-        for stock in stocks:
-            for i in range( math.ceil(iterations) ):
-                await update_stock_direction(stock)
-            await db.update(stock)
+    stock = await get_stock(session, stock_id)
+    if stock is None:
+        return False, "Trying to buy a stock that doesn't exist!"
 
-        
-async def update_market_since_last_action(autosell_callback: Callable[[str], Awaitable]):
-    async with Database(DATABASE_NAME) as db:
-        timestamps = await db.select(Timestamps)
-
-        five_min_diff = math.floor( datetime.datetime.now().minute / 15 ) - math.floor( timestamps.last_market_update.minute / 15 )
-        await do_stock_market_directions_update(db,five_min_diff)
+    _, buy_price = calculate_buy_sell_price(stock)
+    
+    if (buy_price * count) < credit:
+        return True, None
+    else:
+        return False, "Can't afford this purchase!"
+
+async def apply_order(session: Session, stock: Stock, count: float) -> Stock:
+    """
+    Apply an order's price impact and volume to the stored row of `stock`, re-read under the
+    write lock so the impact multiplies the current price. Returns the session's refreshed instance.
+    While the market clock runs it owns the stocks rows, so the order goes to it instead.
+    """
+    if MARKET_CLOCK.running:
+        return MARKET_CLOCK.apply_order(stock.id, count)
+
+    await session.flush()
+    if not session.db.con.in_transaction:
+        await session.db.con.execute("BEGIN IMMEDIATE")
+    current = await session.refresh(Stock, stock.id)
+    order_stock(current, count)
+    await session.db.update(current)
+    return current
+
+# One trade, if it is still open
+OPEN_TRADE = prepare(Trade, (F("id") == Param("id")) & F("sold_at").is_(None))
+
+# Open trades of a stock with an autosell threshold
+AUTOSELL_TRADES = prepare(Trade, (F("stock") == Param("stock")) & F("sold_at").is_(None) & (F("auto_sell_low").is_not(None) | F("auto_sell_high").is_not(None)))
+
+async def load_autosell_index(session: Session):
+    """(Re)build AUTOSELL_INDEX from the open trades, one indexed select per stock."""
+    trades = []
+    for stock in await session.select(Stock):
+        trades += await session.db.select(Trade, where=AUTOSELL_TRADES.bind(stock=stock.id))
+    AUTOSELL_INDEX.load(trades)
+
+def crossed_autosells(stock_ids: list[int], path: stock_engine.PricePath) -> list[tuple[Autosell, tuple[float, float]]]:
+    """
+    Take the trades whose autosell threshold was crossed anywhere on `path` (stock_ids[i] <-> column i)
+    out of the index, each with the sell/buy prices at the first step it was crossed, in the order they
+    were crossed. A long catch-up can cross a threshold and come back; the trade still sells, at that price.
+    """
+    if not len(path):
+        return []
+
+    min_lows, max_highs = path.worst()
+    crossed = []
+    for i, stock_id in enumerate(stock_ids):
+        hits = AUTOSELL_INDEX.crossed(stock_id, float(min_lows[i]), float(max_highs[i]))
+        if not hits:
+            continue
+        lows = np.array([np.nan if hit.low is None else hit.low for hit in hits])
+        highs = np.array([np.nan if hit.high is None else hit.high for hit in hits])
+        for hit, step in zip(hits, path.first_crossing(i, lows, highs).tolist()):
+            crossed.append((step, hit, (float(path.lows[step][i]), float(path.highs[step][i]))))
+
+    crossed.sort(key=lambda c: c[0])
+    return [(hit, prices) for _, hit, prices in crossed]
+
+async def close_autosells(session: Session, autosells: list[tuple[Autosell, tuple[float, float]]]) -> list[str]:
+    """
+    Close the given trades. Returns the messages to announce, which callers send once the session
+    has closed: a slow send mustn't hold the writer.
+    """
+    messages = []
+    for autosell, prices in autosells:
+        success, msg = await close_market_trade(session, autosell.user_id, autosell.trade_id, prices)
+        if (success):
+            messages.append(msg)
+    return messages
+
+async def run_autosells(session: Session, stock_ids: list[int], path: stock_engine.PricePath) -> list[str]:
+    """Close the open trades whose autosell threshold was crossed on `path`. Returns the messages to announce."""
+    if not AUTOSELL_INDEX.loaded:
+        await load_autosell_index(session)
+    return await close_autosells(session, crossed_autosells(stock_ids, path))
+
+async def announce_autosells(messages: list[str], autosell_callback: Callable[[str], Awaitable]):
+    for msg in messages:
+        await autosell_callback(msg)
+
+async def do_stock_market_update(session: Session, dt: float) -> tuple[float, list[str]]:
+    stocks = await session.select(Stock)
+    time_frames = dt / 5.0  # 15 minute intervals
+    market = stock_engine.MarketState.from_stocks(stocks)
+    path = stock_engine.PricePath()
+    dt = stock_engine.advance(market, time_frames, path=path) * 5.0
+    market.write_back(stocks)
 
-        dt = (datetime.datetime.now() - timestamps.last_market_update).total_seconds()
-        dt = await do_stock_market_update(db, dt, autosell_callback)
+    messages = await run_autosells(session, [s.id for s in stocks], path)
+    return dt, messages
 
-        timestamps.last_market_update = datetime.datetime.now() - datetime.timedelta(seconds=dt)
-        await db.update(timestamps)
+async def do_stock_market_directions_update(session: Session, iterations : int):
+    if(iterations>0):
+        stocks = await session.select(Stock)
+        market = stock_engine.MarketState.from_stocks(stocks)
+        stock_engine.update_directions(market, math.ceil(iterations))
+        market.write_back(stocks)
 
-async def stock_market_buy(user_id: int, stock_id: str, count: int, auto_sell_low: Optional[datetime.timedelta], auto_sell_high: Optional[datetime.timedelta]) -> tuple[bool, str]:
-    async with Database(DATABASE_NAME) as db:
-        stocks = await db.select(Stock, where=[WhereParam("code", stock_id.upper())])
-        if not stocks:
-            return False, "Trying to buy a stock that doesn't exist!"
         
-        stock = stocks[0]
-
-        _, buy_price = calculate_buy_sell_price(stock)
-
-        sell_low = auto_sell_low.total_seconds() if auto_sell_low else None
-        sell_high = auto_sell_high.total_seconds() if auto_sell_high else None
-
-        buy = Trade(None, count, buy_price, None, user_id, stock.id, short=False, auto_sell_low=sell_low, auto_sell_high=sell_high)
-        msg =  f"<@{user_id}> bought {count} shares of {stock.code} @ {buy_price}s"
-
-        order_stock(stock, count)
-        await db.insert(buy)
-        await db.update(stock)
-
-        return True, msg
-
-async def stock_market_short(user_id: int, stock_id: str, count: int, auto_sell_low: Optional[datetime.timedelta], auto_sell_high: Optional[datetime.timedelta]) -> tuple[bool, str]:
-    async with Database(DATABASE_NAME) as db:
-        stocks = await db.select(Stock, where=[WhereParam("code", stock_id.upper())])
-        if not stocks:
-            return False, "Trying to short a stock that doesn't exist!"
+async def update_market_since_last_action(autosell_callback: Callable[[str], Awaitable]):
+    if MARKET_CLOCK.running:
+        return  # already current
+    async with Session(DATABASE_NAME) as session:
+        timestamps = await session.select(Timestamps)
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        await do_stock_market_directions_update(session, stock_engine.direction_changes(timestamps.last_market_update, now))
+
+        dt = (now - timestamps.last_market_update).total_seconds()
+        dt, messages = await do_stock_market_update(session, dt)
+
+        timestamps.last_market_update = now - datetime.timedelta(seconds=dt)
+        await session.db.update(timestamps)
+    await announce_autosells(messages, autosell_callback)
+
+async def start_market_clock(autosell_callback: Callable[[str], Awaitable]):
+    """
+    Catch the market up to now, then keep it moving in the background with autosells run every tick.
+    Only stock_market_cog starts it, and that cog is disabled: until it is back the clock, its
+    batched writes and the price history behind get_candles/get_ticks don't run in the bot.
+    """
+    async def on_tick(snapshot: MarketSnapshot, path: stock_engine.PricePath):
+        autosells = crossed_autosells(list(snapshot.by_id), path)
+        if autosells:  # nearly every tick has none, and then there's nothing to open
+            async with Session(DATABASE_NAME, group_commit=True) as session:
+                messages = await close_autosells(session, autosells)
+            await announce_autosells(messages, autosell_callback)
+
+    async with Session(DATABASE_NAME) as session:
+        await load_autosell_index(session)
+    await update_market_since_last_action(autosell_callback)
+    await MARKET_CLOCK.start(on_tick)
+
+async def stop_market_clock():
+    await MARKET_CLOCK.stop()
+
+async def get_candles(stock_id: int, interval: str, start: datetime.datetime, end: datetime.datetime) -> CandleSeries:
+    """OHLC candles ("1m", "15m", "1h" or "1d") of a stock starting in [start, end), as arrays."""
+    return await MARKET_CLOCK.history.candles(stock_id, interval, start, end)
+
+async def get_ticks(stock_id: int, start: datetime.datetime, end: datetime.datetime) -> TickSeries:
+    """Raw prices of a stock in [start, end); only the last couple of days are kept."""
+    return await MARKET_CLOCK.history.ticks(stock_id, start, end)
+
+async def stock_market_buy(user_id: int, stock_id: str, count: int, auto_sell_low: Optional[datetime.timedelta], auto_sell_high: Optional[datetime.timedelta], session: Optional[Session] = None) -> tuple[bool, str]:
+    if session is None:
+        async with Session(DATABASE_NAME, group_commit=True) as session:
+            return await stock_market_buy(user_id, stock_id, count, auto_sell_low, auto_sell_high, session)
+
+    stock = await get_stock(session, stock_id)
+    if stock is None:
+        return False, "Trying to buy a stock that doesn't exist!"
+
+    _, buy_price = calculate_buy_sell_price(stock)
+
+    sell_low = auto_sell_low.total_seconds() if auto_sell_low else None
+    sell_high = auto_sell_high.total_seconds() if auto_sell_high else None
+
+    buy = Trade(None, count, buy_price, None, user_id, stock.id, short=False, auto_sell_low=sell_low, auto_sell_high=sell_high)
+    msg =  f"<@{user_id}> bought {count} shares of {stock.code} @ {buy_price}s"
+
+    session.add(buy)
+    await session.flush()  # for its id
+    AUTOSELL_INDEX.add(buy)
+    await apply_order(session, stock, count)
+
+    return True, msg
+
+async def stock_market_short(user_id: int, stock_id: str, count: int, auto_sell_low: Optional[datetime.timedelta], auto_sell_high: Optional[datetime.timedelta], session: Optional[Session] = None) -> tuple[bool, str]:
+    if session is None:
+        async with Session(DATABASE_NAME, group_commit=True) as session:
+            return await stock_market_short(user_id, stock_id, count, auto_sell_low, auto_sell_high, session)
+
+    stock = await get_stock(session, stock_id)
+    if stock is None:
+        return False, "Trying to short a stock that doesn't exist!"
+
+    buy_price, _ = calculate_buy_sell_price(stock)
+
+    sell_low = auto_sell_low.total_seconds() if auto_sell_low else None
+    sell_high = auto_sell_high.total_seconds() if auto_sell_high else None
+
+    short = Trade(None, count, buy_price, None, user_id, stock.id, short=True, auto_sell_low=sell_low, auto_sell_high=sell_high)
+    msg =  f"<@{user_id}> shorted {count} shares of {stock.code} @ {buy_price}s"
+
+    session.add(short)
+    await session.flush()  # for its id
+    AUTOSELL_INDEX.add(short)
+    await apply_order(session, stock, -count)
         
-        stock = stocks[0]
-
-        buy_price, _ = calculate_buy_sell_price(stock)
-
-        sell_low = auto_sell_low.total_seconds() if auto_sell_low else None
-        sell_high = auto_sell_high.total_seconds() if auto_sell_high else None
-
-        short = Trade(None, count, buy_price, None, user_id, stock.id, short=True, auto_sell_low=sell_low, auto_sell_high=sell_high)
-        msg =  f"<@{user_id}> shorted {count} shares of {stock.code} @ {buy_price}s"
-
-        order_stock(stock, -count)
-        await db.insert(short)
-        await db.update(stock)
-            
-        return True, msg
+    return True, msg
     
-async def close_market_trade(db, user_id: int, trade_id: int) -> tuple[bool, str]:
-    orders = await db.select(Trade, where=[WhereParam("id", trade_id), WhereParam("user_id", user_id), WhereParam("sold_at", None, "IS")])
-    if not orders:
+async def close_market_trade(session: Session, user_id: int, trade_id: int, prices: Optional[tuple[float, float]] = None) -> tuple[bool, str]:
+    """Close a trade at the current sell price, or at `prices` (sell, short sell) if given, e.g. where an autosell fired."""
+    order = await session.get(Trade, trade_id)
+    if order is None or order.user_id != user_id or order.sold_at is not None:
         return False, "Trying to close a trade that doesn't exist."
-    
-    order = orders[0]
 
-    stocks = await db.select(Stock, where=[WhereParam("id", order.stock)])
-    if not stocks:
+    stock = MARKET_CLOCK.snapshot.by_id.get(order.stock) if MARKET_CLOCK.running else await session.get(Stock, order.stock)
+    if stock is None:
         return False, "Trying to close a trade for a stock that doesn't exist."
     
-    stock = stocks[0]
     pl = 0.0
 
-    sell_price, sell_price_short = calculate_buy_sell_price(stock)
+    sell_price, sell_price_short = prices or calculate_buy_sell_price(stock)
 
     order.sold_at = sell_price_short if order.short else sell_price
     pl += order.sold_at - order.bought_at
     pl *= order.count
 
-    await db.update(order)
-    order_stock(stock, order.count if order.short else -order.count)
-    await db.update(stock)
+    # Only close it if nothing else (e.g. an autosell) got there first
+    if not await session.db.update(order, OPEN_TRADE.bind(id=order.id), returning=True):
+        order.sold_at = None
+        return False, "Trying to close a trade that doesn't exist."
+    AUTOSELL_INDEX.discard(order.id)
+    await apply_order(session, stock, order.count if order.short else -order.count)
 
     if order.short:
         pl *= -1
 
     return True, f"<@{user_id}> sold {order.count} shares of {stock.code} for a profit/loss of {'+' if pl > 0 else '-'}{datetime.timedelta(seconds=abs(round(pl)))}"
 
-async def stock_market_sell(user_id: int, trade_id: int) -> tuple[bool, str]:
-    async with Database(DATABASE_NAME) as db:
-        return await close_market_trade(db, user_id, trade_id)
+async def stock_market_sell(user_id: int, trade_ids: list[int]) -> list[tuple[bool, str]]:
+    """Close several trades in one session; stocks shared between them are only loaded once."""
+    async with Session(DATABASE_NAME, group_commit=True) as session:
+        return [await close_market_trade(session, user_id, trade_id) for trade_id in trade_ids]
     
 
 async def stock_market_update_trade(user_id: int, trade_id: int, auto_sell_low: Optional[datetime.timedelta], auto_sell_high: Optional[datetime.timedelta]) -> tuple[bool, str]:
-    async with Database(DATABASE_NAME) as db:
-        orders = await db.select(Trade, where=[WhereParam("id", trade_id), WhereParam("user_id", user_id), WhereParam("sold_at", None, "IS")])
-        if not orders:
+    async with Session(DATABASE_NAME, group_commit=True) as session:
+        order = await session.get(Trade, trade_id)
+        if order is None or order.user_id != user_id or order.sold_at is not None:
             return False, "Trying to update a trade that doesn't exist."
-        
-        order = orders[0]
 
         if auto_sell_low:
             order.auto_sell_low = auto_sell_low.total_seconds()
@@ -165,6 +290,5 @@ async def stock_market_update_trade(user_id: int, trade_id: int, auto_sell_low:
         if auto_sell_high:
             order.auto_sell_high = auto_sell_high.total_seconds()
 
-        await db.update(order)
-        return True, "Successfully updated your trade with new auto-sell thresholds."
-        
\ No newline at end of file
+        AUTOSELL_INDEX.add(order)
+        return True, "Successfully updated your trade with new auto-sell thresholds."
\ No newline at end of file
@@ -0,0 +1,271 @@
+import datetime
+import math
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Optional
+from utils.stocks.stock_control_params import *
+from ..model import Stock
+
+
+#-----------------------------------------------------------------
+#   Vectorised market engine
+#
+#   The same dynamics as stock_controls (update_stock_rand + update_stock per step,
+#   update_stock_direction per direction change), on one array per Stock field so every
+#   stock advances in lockstep. Stocks don't interact, so this is exact across stocks.
+#   Steps still run one after another (each depends on the clamped state of the last),
+#   but all the random draws for a catch-up are made up front in one call.
+
+MAX_STEP = 100  # frames per step, as update_stocks_rand
+SMALL_MARKET = 12  # below this many stocks a step is cheaper on plain floats than as ufunc calls
+DIRECTION_SECONDS = 15 * 60  # actor targets move on every 15 minute boundary
+
+_rng = np.random.default_rng()
+
+
+@dataclass
+class MarketState:
+    """Struct-of-arrays view of a list of stocks, index i <-> stocks[i]."""
+    value: np.ndarray
+    drift: np.ndarray
+    volatility: np.ndarray
+    volume: np.ndarray
+    volume_this_frame: np.ndarray
+    actor_target_price: np.ndarray
+    traded: np.ndarray  # shares traded either way since last reset, not stored on Stock
+
+    @classmethod
+    def from_stocks(cls, stocks: list[Stock]) -> "MarketState":
+        def column(name: str) -> np.ndarray:
+            return np.fromiter((getattr(s, name) for s in stocks), dtype=np.float64, count=len(stocks))
+        return cls(
+            value=column("value"),
+            drift=column("drift"),
+            volatility=column("volatility"),
+            volume=column("volume"),
+            volume_this_frame=column("volume_this_frame"),
+            actor_target_price=column("actor_target_price"),
+            traded=np.zeros(len(stocks)),
+        )
+
+    def write_back(self, stocks: list[Stock]) -> None:
+        """Copy the arrays back onto the Stock objects (plain floats, so change tracking compares cleanly)."""
+        columns = (
+            self.value.tolist(), self.drift.tolist(), self.volatility.tolist(), self.volume.tolist(),
+            self.volume_this_frame.tolist(), self.actor_target_price.tolist(),
+        )
+        for stock, (value, drift, volatility, volume, volume_this_frame, target) in zip(stocks, zip(*columns)):
+            stock.value = value
+            stock.drift = drift
+            stock.volatility = volatility
+            stock.volume = volume
+            stock.volume_this_frame = volume_this_frame
+            stock.actor_target_price = target
+
+
+@dataclass
+class PricePath:
+    """
+    Sell (low) and buy (high) prices of every stock after each step of an advance(), so
+    thresholds can be checked against the whole path rather than just where it ended.
+    """
+    lows: list[np.ndarray] = field(default_factory=list)
+    highs: list[np.ndarray] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._extremes: Optional[tuple[np.ndarray, np.ndarray]] = None
+
+    def record(self, state: MarketState) -> None:
+        self.append(*buy_sell_prices(state))
+
+    def append(self, lows: np.ndarray, highs: np.ndarray) -> None:
+        self.lows.append(lows)
+        self.highs.append(highs)
+        self._extremes = None
+
+    def extremes(self) -> tuple[np.ndarray, np.ndarray]:
+        """Running minimum sell price and running maximum buy price, shape (steps, stocks)."""
+        if self._extremes is None:
+            self._extremes = (np.minimum.accumulate(np.array(self.lows), axis=0), np.maximum.accumulate(np.array(self.highs), axis=0))
+        return self._extremes
+
+    def worst(self) -> tuple[np.ndarray, np.ndarray]:
+        """Lowest sell and highest buy price each stock reached anywhere on the path."""
+        min_low, max_high = self.extremes()
+        return min_low[-1], max_high[-1]
+
+    def first_crossing(self, i: int, lows: np.ndarray, highs: np.ndarray) -> np.ndarray:
+        """
+        For thresholds on stock `i` (NaN where a trade has none), the first step at which the sell
+        price fell below `lows` or the buy price rose above `highs`; len(path) where neither did.
+        The running extremes are monotonic, so this is a binary search per threshold.
+        """
+        min_low, max_high = self.extremes()
+        low_step = np.searchsorted(-min_low[:, i], -lows, side="right")
+        high_step = np.searchsorted(max_high[:, i], highs, side="right")
+        return np.minimum(low_step, high_step)
+
+    def __len__(self) -> int:
+        return len(self.lows)
+
+
+def step_sizes(frames: float) -> list[float]:
+    """update_stocks_rand's steps: MAX_STEP frames at a time, then the remainder."""
+    steps = []
+    while frames > 0:
+        steps.append(min(MAX_STEP, frames))
+        frames -= steps[-1]
+    return steps
+
+
+def liquidity(volume: np.ndarray) -> np.ndarray:
+    return np.power(np.maximum(volume, 1), STOCK_LIQUIDITY_COFF)
+
+
+def buy_sell_prices(state: MarketState) -> tuple[np.ndarray, np.ndarray]:
+    """calculate_buy_sell_price for every stock."""
+    market_term = STOCK_SPREAD_VOLATILITY_FACTOR * state.volatility / (state.volume ** STOCK_SPREAD_VOLUME_FACTOR)
+    spread = np.minimum(0.10, STOCK_BASE_PRICE_SPREAD + market_term)
+    return state.value * (1 - spread), state.value * (1 + spread)
+
+
+def direction_changes(since: datetime.datetime, now: datetime.datetime) -> int:
+    """How many 15 minute boundaries lie in (since, now]. Counted from the epoch, so whole hours and days count too."""
+    return math.floor(now.timestamp() / DIRECTION_SECONDS) - math.floor(since.timestamp() / DIRECTION_SECONDS)
+
+
+def update_directions(state: MarketState, iterations: int, rng: np.random.Generator = _rng) -> None:
+    """update_stock_direction `iterations` times on every stock."""
+    if iterations <= 0:
+        return
+    steps = rng.normal(0, 0.5, size=(iterations, len(state.value)))
+    target = state.actor_target_price
+    for step in steps:
+        # clamped every iteration, as the scalar version
+        target = np.minimum(np.maximum(target * np.power(STOCK_ACTOR_DIR_ALTERNATOR, step), 0.0001), 1000)
+    state.actor_target_price = target
+
+
+def advance(state: MarketState, frames: float, rng: np.random.Generator = _rng, path: Optional[PricePath] = None) -> float:
+    """
+    Simulate `frames` frames of actor trading and price movement on every stock, recording
+    the prices after each step into `path` if given.
+    Returns the frames left over (always 0, as update_stocks_rand).
+    """
+    steps = step_sizes(frames)
+    if not steps or not len(state.value):
+        return 0
+
+    noise = rng.standard_normal(size=(len(steps), 3, len(state.value)))
+    if len(state.value) < SMALL_MARKET:
+        clamped = _advance_small(state, steps, noise, path)
+    else:
+        clamped = _advance_vector(state, steps, noise, path)
+
+    if clamped:
+        print(f'Clamped {clamped} out of range price steps over {len(steps)} steps')
+    return 0
+
+
+def _advance_vector(state: MarketState, steps: list[float], noise: np.ndarray, path: Optional[PricePath]) -> int:
+    zeros = np.zeros(len(state.value))
+    clamped = 0
+    for dt, (n_drift, n_trade, z) in zip(steps, noise):
+        root_dt = math.sqrt(dt)
+
+        # --- actors trade towards their target price (update_stock_rand) ---
+        force_drift_power = (np.log2(state.actor_target_price) - np.log2(state.value)) * STOCK_ACTOR_SHIFT_CORR_POWER
+        trade_credit = (dt * STOCK_ACTOR_SIM_SOFT_RANGE) * force_drift_power + (dt * STOCK_ACTOR_SIM_SOFT_RANGE / 4) * n_drift \
+                     + (root_dt * STOCK_ACTOR_SIM_SOFT_RANGE / 2) * n_trade
+        trade_count = np.minimum(np.maximum(trade_credit, -3600), 3600) / state.value
+        state.traded = state.traded + np.absolute(trade_count)
+
+        # order_stock
+        impact = 1 + STOCK_PRICE_IMPACT * trade_count / liquidity(state.volume)
+        state.value = np.minimum(np.maximum(state.value * impact, 0.1), 1000)
+        d_vol = state.volume_this_frame + trade_count
+
+        # --- volume, trend and price (update_stock) ---
+        vol_decay = STOCK_VOLUME_ALPHA ** dt
+        trend_decay = STOCK_DECAY_FACTOR ** dt
+
+        state.volume = vol_decay * state.volume + (1 - vol_decay) * (d_vol * d_vol)
+        direction = 2 * d_vol / liquidity(state.volume)
+
+        drift = trend_decay * state.drift + ((1 - trend_decay) * STOCK_DRIFT_IMPACT) * direction
+        state.drift = np.minimum(np.maximum(drift, -1), 1)
+        volatility = trend_decay * state.volatility + ((1 - trend_decay) * STOCK_VOLATILITY_IMPACT) * np.absolute(direction)
+        state.volatility = np.minimum(np.maximum(volatility, 0), 1)
+
+        # Geometric brownian motion
+        mu, sigma = state.drift, state.volatility
+        step_dir = np.exp((mu - 0.5 * sigma * sigma) * dt + sigma * (root_dt * z))
+        low, high = 0.5 ** dt, 2 ** dt
+        if step_dir.min() <= low or step_dir.max() > high:
+            out_of_range = (step_dir <= low) | (step_dir > high)
+            clamped += int(out_of_range.sum())
+            step_dir = np.where(out_of_range, np.minimum(np.maximum(step_dir, 0.6 ** dt), 1.4 ** dt), step_dir)
+        state.value = np.minimum(np.maximum(state.value * step_dir, 0.1), 1000)
+
+        state.volume_this_frame = zeros
+        if path is not None:
+            path.record(state)
+    return clamped
+
+
+def _advance_small(state: MarketState, steps: list[float], noise: np.ndarray, path: Optional[PricePath]) -> int:
+    """
+    The same step as _advance_vector, one stock at a time on plain floats. Each ufunc call has a
+    fixed cost of about a microsecond whatever the array length, so for a market the size of
+    the live one (7 stocks) this is faster than the vector step; same draws, same dynamics.
+    """
+    value, drift, volatility = state.value.tolist(), state.drift.tolist(), state.volatility.tolist()
+    volume, volume_this_frame = state.volume.tolist(), state.volume_this_frame.tolist()
+    target, traded = state.actor_target_price.tolist(), state.traded.tolist()
+    stocks = range(len(value))
+    clamped = 0
+    for dt, (n_drift, n_trade, z) in zip(steps, noise.tolist()):
+        root_dt = math.sqrt(dt)
+        vol_decay = STOCK_VOLUME_ALPHA ** dt
+        trend_decay = STOCK_DECAY_FACTOR ** dt
+        low, high = 0.5 ** dt, 2 ** dt
+        lows, highs = [], []
+        for i in stocks:
+            v = value[i]
+
+            # --- actors trade towards their target price (update_stock_rand) ---
+            force_drift_power = (math.log2(target[i]) - math.log2(v)) * STOCK_ACTOR_SHIFT_CORR_POWER
+            trade_credit = dt * (STOCK_ACTOR_SIM_SOFT_RANGE * force_drift_power + (STOCK_ACTOR_SIM_SOFT_RANGE / 4) * n_drift[i]) \
+                         + (root_dt * STOCK_ACTOR_SIM_SOFT_RANGE / 2) * n_trade[i]
+            trade_count = min(3600, max(trade_credit, -3600)) / v
+            traded[i] += abs(trade_count)
+
+            # order_stock
+            v = min(1000, max(v * (1 + STOCK_PRICE_IMPACT * trade_count / max(volume[i], 1) ** STOCK_LIQUIDITY_COFF), 0.1))
+            d_vol = volume_this_frame[i] + trade_count
+            volume_this_frame[i] = 0.0
+
+            # --- volume, trend and price (update_stock) ---
+            vol = volume[i] = vol_decay * volume[i] + (1 - vol_decay) * (d_vol * d_vol)
+            direction = 2 * d_vol / max(vol, 1) ** STOCK_LIQUIDITY_COFF
+            mu = drift[i] = min(1, max(trend_decay * drift[i] + (1 - trend_decay) * STOCK_DRIFT_IMPACT * direction, -1))
+            sigma = volatility[i] = min(1, max(trend_decay * volatility[i] + (1 - trend_decay) * STOCK_VOLATILITY_IMPACT * abs(direction), 0))
+
+            # Geometric brownian motion
+            step_dir = math.exp((mu - 0.5 * sigma * sigma) * dt + sigma * root_dt * z[i])
+            if step_dir <= low or step_dir > high:
+                clamped += 1
+                step_dir = min(1.4 ** dt, max(step_dir, 0.6 ** dt))
+            v = value[i] = min(1000, max(v * step_dir, 0.1))
+
+            if path is not None:
+                spread = min(0.10, STOCK_BASE_PRICE_SPREAD + STOCK_SPREAD_VOLATILITY_FACTOR * sigma / (vol ** STOCK_SPREAD_VOLUME_FACTOR))
+                lows.append(v * (1 - spread))
+                highs.append(v * (1 + spread))
+        if path is not None:
+            path.append(np.array(lows), np.array(highs))
+
+    state.value, state.drift, state.volatility = np.array(value), np.array(drift), np.array(volatility)
+    state.volume, state.volume_this_frame = np.array(volume), np.array(volume_this_frame)
+    state.traded = np.array(traded)
+    return clamped
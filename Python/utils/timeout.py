@@ -1,22 +1,114 @@
+import asyncio
+import discord
 from .database import *
+from .bot import get_timeout_data, timeout_from_audit_entry, accumulate_timeouts, untimed_members
 
 async def get_timeout_leaderboard() -> list[User]:
-    async with Database(DATABASE_NAME) as db:
+    async with Database(DATABASE_NAME, readonly=True) as db:
         return await db.select(User, order=[OrderParam("count", True), OrderParam("duration", True)])
 
-async def update_timeout_leaderboard(user: int, duration: float):   
+async def add_timeout_user(member: discord.Member):
+    """Give a member who just joined their (zero) row, so they have a balance before they are ever timed out."""
+    if member.bot or member.id == member.guild.owner_id:
+        return
     async with Database(DATABASE_NAME) as db:
-        timeouts_for_user = await db.select(User, where=[WhereParam("id", user)])
-        if (len(timeouts_for_user) > 0):
-            timeout = timeouts_for_user[0]
-            timeout.count += 1 if duration > 0 else 0
-            timeout.duration += duration
-            await db.update(timeout, [WhereParam("id", user)])
-        else:
-            timeout = User(user, 1 if duration > 0 else 0, duration)
-            await db.insert(timeout)
+        await db.insert_missing([User(member.id, 0, 0)])
 
 
 async def erase_timeout_user(user: int):
     async with Database(DATABASE_NAME) as db:
-        await db.delete(User, [WhereParam("id", user), ])
\ No newline at end of file
+        await db.delete(User, [WhereParam("id", user), ])
+
+
+#-----------------------------------------------------------------
+#   Audit-log ingestion
+#
+#   users holds the totals of every member_update audit-log entry up to the one recorded in
+#   AuditLogCheckpoint. Startup and reconnects only fetch entries newer than that; the whole
+#   history is only walked when there's no checkpoint yet or on request. Once caught up, new
+#   entries come from the gateway and are folded in one at a time, without a REST call.
+
+_INGEST_LOCK = asyncio.Lock()  # one ingestion at a time, or two could fold the same entries
+_caught_up = False  # the checkpoint is right behind the gateway feed; cleared on disconnect
+
+async def get_audit_log_checkpoint(db: Database) -> Optional[int]:
+    cur = await db.execute(f"SELECT last_entry_id FROM {model_info(AuditLogCheckpoint).table}")
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+
+async def ingest_timeouts(guild: discord.Guild | None, full: bool = False) -> int:
+    """
+    Fold audit-log entries newer than the checkpoint into users and advance the checkpoint,
+    in one transaction. With `full` (or no checkpoint yet) rebuild users from the whole history.
+    Returns the number of entries read, or for a rebuild the number of members written.
+    """
+    global _caught_up
+    if guild is None:
+        return 0
+
+    async with _INGEST_LOCK:
+        async with Database(DATABASE_NAME) as db:
+            checkpoint = await get_audit_log_checkpoint(db)
+
+        if full or checkpoint is None:
+            read = await _rebuild_timeouts(guild)
+        else:
+            read = await _ingest_since(guild, checkpoint)
+        _caught_up = True
+        return read
+
+
+async def fold_audit_log_entry(guild: discord.Guild, entry: discord.AuditLogEntry) -> None:
+    """
+    Fold a member_update entry from the gateway into users. Falls back to ingest_timeouts
+    when entries may have been missed since the checkpoint (not caught up since connecting).
+    """
+    async with _INGEST_LOCK:
+        if _caught_up:
+            async with Database(DATABASE_NAME) as db:
+                checkpoint = await get_audit_log_checkpoint(db)
+                if checkpoint is not None and entry.id > checkpoint:
+                    timeout = timeout_from_audit_entry(guild, entry)
+                    if timeout is not None:
+                        await db.increment(User, timeout.id, count=timeout.count, duration=timeout.duration)
+                    await db.insert_or_update(AuditLogCheckpoint(entry.id))
+            return
+    await ingest_timeouts(guild)
+
+
+def mark_disconnected() -> None:
+    """Gateway events may be missed until the next ingest_timeouts."""
+    global _caught_up
+    _caught_up = False
+
+
+async def _ingest_since(guild: discord.Guild, checkpoint: int) -> int:
+    timeouts: list[User] = []
+    last_entry_id = checkpoint
+    read = 0
+    async for entry in guild.audit_logs(limit=None, action=discord.AuditLogAction.member_update, after=discord.Object(id=checkpoint)):
+        read += 1
+        last_entry_id = max(last_entry_id, entry.id)
+        timeout = timeout_from_audit_entry(guild, entry)
+        if timeout is not None:
+            timeouts.append(timeout)
+
+    async with Database(DATABASE_NAME) as db:
+        # members who joined since the last rebuild get a row (and so a balance) even if never timed out
+        await db.insert_missing(untimed_members(guild))
+        for t in accumulate_timeouts(timeouts).values():
+            await db.increment(User, t.id, count=t.count, duration=t.duration)
+        if last_entry_id != checkpoint:
+            await db.insert_or_update(AuditLogCheckpoint(last_entry_id))
+    return read
+
+
+async def _rebuild_timeouts(guild: discord.Guild) -> int:
+    leaderboard, last_entry_id = await get_timeout_data(guild)
+    async with Database(DATABASE_NAME) as db:
+        await db.delete(User)
+        await db.upsert_many(leaderboard)
+        await db.insert_or_update(AuditLogCheckpoint(last_entry_id))
+    print(f"Rebuilt the timeout leaderboard for {len(leaderboard)} members")
+    return len(leaderboard)
@@ -8,7 +8,6 @@ import utils.database as db_utils
 import utils.log as log_utils
 from utils.model import Purchase
 import utils.shop as shop_utils
-import traceback
 
 _log = logging.getLogger(__name__)
 _log.addHandler(logging.FileHandler('data/logs.log', encoding='utf-8'))
@@ -65,22 +64,23 @@ class ShopOptionsView(discord.ui.View):
             
             cost = item_cost * count
 
-            if await shop_utils.can_afford_purchase(interaction.user.id, cost):
-                db = await db_utils.Database(db_utils.DATABASE_NAME, defer_commit=True).connect()
+            # Commit the purchase up front rather than holding the writer connection
+            # across the Discord calls in handle_purchase; refund it if the handler fails.
+            purchase = Purchase(None, datetime.datetime.now(datetime.timezone.utc), item.ITEM_ID, cost, interaction.user.id, item.AUTO_USE)
+            if await shop_utils.spend(interaction.user.id, cost, purchase):
                 try:
-                    await db.insert(Purchase(None, datetime.datetime.now(), item.ITEM_ID, cost, interaction.user.id, item.AUTO_USE))
                     await view.item.handle_purchase(interaction, view.context)
-                    await db.commit()
-
-                    await interaction.edit_original_response(
-                        view=None, content=f"✅ Purchased **{view.item.DESCRIPTION}** ({desc})."
-                    )
-                except BaseException as e:
-                    await db.rollback()
+                except Exception:
+                    async with db_utils.Database(db_utils.DATABASE_NAME) as db:
+                        await db.delete(Purchase, where=[db_utils.WhereParam("id", purchase.id)])
                     await interaction.edit_original_response(
                         view=None, content=f"❌ Purchase failed to process."
                     )
-                    traceback.print_exception(e)
+                    raise
+
+                await interaction.edit_original_response(
+                    view=None, content=f"✅ Purchased **{view.item.DESCRIPTION}** ({desc})."
+                )
 
             else:
                 await interaction.edit_original_response(